@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Multi-process farm of browser workers for Selenium lookups.
+
+One headless browser can only work through Starken and Cruz del Sur
+lookups one at a time.  ``BrowserFarm`` runs N worker processes, each with
+its own reused browser session, and feeds them from one shared queue of
+``(carrier, tracking_number)`` items:
+
+* N is sized from a memory budget (``FarmConfig.workers``),
+* an idle worker asks the supervisor for the next item,
+* a worker whose process tree exceeds its RSS limit, or whose lookup runs
+  past the timeout, is killed and restarted, and its item is retried.
+
+RSS checks need the optional ``psutil`` package; without it the farm still
+runs but only enforces the timeout.
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+try:  # optional dependency, only needed for the memory limit
+    import psutil
+except ImportError:  # pragma: no cover - depends on environment
+    psutil = None
+
+Item = Tuple[str, str]
+
+
+@dataclass
+class FarmConfig:
+    """Sizing and health limits of the farm."""
+
+    memory_budget_mb: int = 4096
+    worker_limit_mb: int = 700
+    task_timeout: float = 300.0
+    max_workers: Optional[int] = None
+    max_attempts: int = 2
+    max_restarts: int = 20
+
+    def workers(self) -> int:
+        """Number of workers that fit in the memory budget (at least one)."""
+
+        fit = self.memory_budget_mb // max(1, self.worker_limit_mb)
+        cap = self.max_workers or os.cpu_count() or 1
+        return max(1, min(fit, cap))
+
+
+def browser_lookup(
+    carrier: str, tracking: str, session: Callable, deadline: Optional[float] = None
+) -> str:
+    """Default worker lookup.
+
+    ``session()`` returns the worker's browser, opening it on first use, so
+    a Starken status found over HTTP never starts Chrome.  ``deadline`` is a
+    ``time.time()`` value after which waits are cut short.
+    """
+
+    from shipping_tracker import _status_starken_browser, consulta_cruz_del_sur, status_starken_http
+
+    if carrier.lower() == "cruz del sur":
+        estado = consulta_cruz_del_sur(tracking, session=session(), deadline=deadline)
+        return estado or "Requiere consulta manual"
+    return status_starken_http(tracking) or _status_starken_browser(
+        tracking, session(), deadline=deadline
+    )
+
+
+def open_browser(carrier: str):
+    """Default session factory: a driver with the profile ``carrier`` needs."""
+
+    from shipping_tracker import Chrome, browser_profile, cruz_profile
+
+    return Chrome(cruz_profile() if carrier.lower() == "cruz del sur" else browser_profile()).driver
+
+
+def _worker_main(conn, lookup: Callable, session_factory: Callable) -> None:
+    """Worker loop: ask for an item, look it up, send the status back.
+
+    The browser is opened by ``session_factory(carrier)`` the first time a
+    lookup asks for it and reused while the carrier stays the same.  Each
+    reply carries the ``(name, start, end)`` wall-clock spans of the item,
+    so the supervisor can trace the worker on its own track.
+    """
+
+    session = None
+    session_carrier = None
+    try:
+        conn.send(("ready", None, None, []))
+        while True:
+            item = conn.recv()
+            if item is None:
+                break
+            carrier, tracking = item
+            spans = []
+
+            def get_session():
+                nonlocal session, session_carrier
+                if session is None or session_carrier != carrier.lower():
+                    _quit(session)
+                    start = time.time()
+                    session = session_factory(carrier)
+                    session_carrier = carrier.lower()
+                    spans.append(("open_browser", start, time.time()))
+                return session
+
+            start = time.time()
+            try:
+                status = lookup(carrier, tracking, get_session)
+            except Exception as exc:  # pragma: no cover - network
+                status = f"Error Selenium: {exc}"
+            spans.append(("lookup", start, time.time()))
+            if status.startswith("Error Selenium"):
+                # The session may be broken; start a clean one next time.
+                _quit(session)
+                session = None
+            conn.send(("done", item, status, spans))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        _quit(session)
+
+
+def _quit(session) -> None:
+    if session is not None:
+        try:
+            session.quit()
+        except Exception:
+            pass
+
+
+# Workers start from a fresh interpreter: forking the supervisor would copy
+# its threads' locks (lookup pool, tracer) in whatever state they are in.
+_MP = mp.get_context("spawn")
+
+
+class _Worker:
+    """Supervisor-side handle of a worker process."""
+
+    def __init__(self, wid: int, lookup: Callable, session_factory: Callable) -> None:
+        self.wid = wid
+        self.conn, child = _MP.Pipe()
+        self.process = _MP.Process(
+            target=_worker_main,
+            args=(child, lookup, session_factory),
+            name=f"browser-{wid}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.item: Optional[Item] = None
+        self.started = 0.0
+
+    def rss_mb(self) -> Optional[float]:
+        """Resident memory of the worker and its browser processes."""
+
+        if psutil is None:
+            return None
+        try:
+            proc = psutil.Process(self.process.pid)
+            procs = [proc] + proc.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+    def kill(self) -> None:
+        """Kill the worker together with its browser and driver processes."""
+
+        if psutil is not None:
+            try:
+                children = psutil.Process(self.process.pid).children(recursive=True)
+            except psutil.Error:
+                children = []
+            for child in children:
+                try:
+                    child.kill()
+                except psutil.Error:
+                    pass
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class BrowserFarm:
+    """Run browser lookups in a pool of supervised worker processes.
+
+    Use as a context manager: ``submit`` items while the farm runs and
+    leaving the block waits until every submitted item has a result.
+    ``on_result(carrier, tracking, status)`` is called from the supervisor
+    thread as results arrive.  With a ``tracer`` (``shipping_tracker.Tracer``)
+    the spans of each worker are added on a ``browser-<n>`` track.
+
+    ``lookup(carrier, tracking, session)`` and ``session_factory(carrier)``
+    run in the workers, so they must be picklable module-level callables;
+    ``session`` is a no-argument callable returning the browser.
+    """
+
+    def __init__(
+        self,
+        config: Optional[FarmConfig] = None,
+        on_result: Optional[Callable[[str, str, str], None]] = None,
+        *,
+        lookup: Callable = browser_lookup,
+        session_factory: Callable = open_browser,
+        poll_interval: float = 1.0,
+        tracer=None,
+    ) -> None:
+        self.config = config or FarmConfig()
+        self.on_result = on_result
+        self.lookup = lookup
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.tracer = tracer
+        self.results: Dict[Item, str] = {}
+        self.restarts = 0
+        self._inbox: "queue.Queue[Optional[Item]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._supervise, name="browser-farm", daemon=True)
+        self._error: Optional[BaseException] = None
+        self._abort = threading.Event()
+
+    def __enter__(self) -> "BrowserFarm":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            # Interrupted: stop the workers instead of draining the queue.
+            self._abort.set()
+        self._inbox.put(None)
+        self._thread.join()
+        if self._error is not None and exc is None:
+            raise self._error
+
+    def submit(self, carrier: str, tracking: str) -> None:
+        self._inbox.put((carrier, tracking))
+
+    # -- supervisor ----------------------------------------------------------
+
+    def _supervise(self) -> None:
+        try:
+            self._loop()
+        except BaseException as exc:  # surfaced in __exit__
+            self._error = exc
+
+    def _loop(self) -> None:
+        pending: Deque[Item] = deque()
+        attempts: Counter = Counter()
+        workers: Dict[int, _Worker] = {}
+        idle: List[_Worker] = []
+        next_id = 0
+        closed = False
+
+        def spawn() -> None:
+            nonlocal next_id
+            workers[next_id] = _Worker(next_id, self.lookup, self.session_factory)
+            next_id += 1
+
+        def finish(item: Item, status: str) -> None:
+            self.results[item] = status
+            if self.on_result is not None:
+                self.on_result(item[0], item[1], status)
+
+        def replace_worker(w: _Worker, reason: str) -> None:
+            print(f"Reiniciando navegador {w.wid}: {reason}")
+            w.kill()
+            del workers[w.wid]
+            if w in idle:
+                idle.remove(w)
+            self.restarts += 1
+            if self.restarts > self.config.max_restarts:
+                raise RuntimeError(f"Demasiados reinicios de navegador ({self.restarts})")
+            if w.item is not None:
+                attempts[w.item] += 1
+                if attempts[w.item] >= self.config.max_attempts:
+                    finish(w.item, f"Error: {reason}")
+                else:
+                    pending.appendleft(w.item)
+            spawn()
+
+        try:
+            while True:
+                # Move newly submitted items into the shared queue.
+                while True:
+                    try:
+                        item = self._inbox.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        closed = True
+                    else:
+                        pending.append(item)
+                busy = [w for w in workers.values() if w.item is not None]
+                if self._abort.is_set() or (closed and not pending and not busy):
+                    return
+                # Start workers lazily, up to the budget.
+                while pending and len(workers) < min(self.config.workers(), len(pending) + len(busy)):
+                    spawn()
+                while idle and pending:
+                    w = idle.pop()
+                    w.item = pending.popleft()
+                    w.started = time.monotonic()
+                    w.conn.send(w.item)
+
+                conns = {w.conn: w for w in workers.values()}
+                for conn in wait(list(conns), timeout=self.poll_interval):
+                    w = conns[conn]
+                    try:
+                        kind, item, status, spans = conn.recv()
+                    except (EOFError, OSError):
+                        replace_worker(w, "el proceso terminó inesperadamente")
+                        continue
+                    if self.tracer is not None:
+                        for name, start, end in spans:
+                            self.tracer.add(
+                                name, start, end, f"browser-{w.wid}", carrier=item[0], tracking=item[1]
+                            )
+                    if kind == "done":
+                        finish(item, status)
+                        w.item = None
+                    idle.append(w)
+
+                now = time.monotonic()
+                for w in list(workers.values()):
+                    if w.item is None:
+                        continue
+                    if now - w.started > self.config.task_timeout:
+                        replace_worker(w, f"sin respuesta por {self.config.task_timeout:.0f} s")
+                        continue
+                    rss = w.rss_mb()
+                    if rss is not None and rss > self.config.worker_limit_mb:
+                        replace_worker(w, f"usa {rss:.0f} MB (límite {self.config.worker_limit_mb} MB)")
+        finally:
+            for w in workers.values():
+                try:
+                    w.conn.send(None)
+                except OSError:
+                    pass
+            for w in workers.values():
+                if self._abort.is_set():
+                    w.kill()
+                    continue
+                w.process.join(10)
+                if w.process.is_alive():
+                    w.kill()
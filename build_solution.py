@@ -1,87 +1,228 @@
-import os, io, json, base64, zipfile, textwrap
-from datetime import datetime
-
-# ---------- 1. Pega aquí el FLOW JSON completo ----------
-FLOW_JSON = """
-{ "$schema":"https://schema.management.azure.com/providers/Microsoft.Logic/schemas/2025-06-01/workflowdefinition.json#",
-  "contentVersion":"1.0.0.0",
-  "parameters":{},
-  "triggers":{  /* ... TU BLOQUE COMPLETO ... */ },
-  "actions":{   /* ...                           */ },
-  "outputs":{},
-  "connectionReferences":{ /* ... */ }
-}
-""".strip()
+import os, io, json, base64, zipfile, hashlib, textwrap, uuid, glob, argparse
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# ---------- 1. Fuentes de flujos ----------
+# Se empaquetan todas las definiciones encontradas en estas rutas.
+FLOW_PATTERNS = [
+    "flow_definition.json",
+    os.path.join("flows", "*.json"),
+    os.path.join("solution", "Workflows", "*", "definition.json"),
+]
+# flow_definition.json es la fuente del flujo de stock
+ROOT_FLOW_NAME = "ActualizarStock_Compras"
+
 # ---------- 2. Variables de solución ----------
-SOLUTION_NAME   = "ActualizarStock_Compras_Solution"
-DISPLAY_NAME    = "Actualizar Stock – Compras"
-FLOW_GUID       = "{11111111-2222-3333-4444-555555555555}"
 PUBLISHER_UNAME = "codx"
 PUBLISHER_PREF  = "codx"
 VERSION         = "1.0.0.0"
+# GUIDs ya publicados; el resto se deriva del nombre para que sea estable
+KNOWN_GUIDS = {"ActualizarStock_Compras": "{11111111-2222-3333-4444-555555555555}"}
+DISPLAY_NAMES = {"ActualizarStock_Compras": "Actualizar Stock – Compras"}
+# Cambiar al modificar las plantillas: invalida la caché de compilación
+BUILDER_VERSION = "2"
+CACHE_FILE = ".build_cache.json"
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+@dataclass
+class FlowSource:
+    name: str
+    path: str
+    display_name: str
+    definition: dict
+
+    @property
+    def guid(self) -> str:
+        if self.name in KNOWN_GUIDS:
+            return KNOWN_GUIDS[self.name]
+        return "{%s}" % uuid.uuid5(uuid.NAMESPACE_URL, f"codx/flows/{self.name}")
+
+    def digest(self) -> str:
+        """Hash de todo lo que entra en el ZIP (no del formato del archivo)."""
+        canon = json.dumps(
+            [BUILDER_VERSION, VERSION, self.name, self.display_name, self.definition],
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+# ---------- 3. Descubrir y validar ----------
+def _flow_name(rel_path: str) -> str:
+    parts = rel_path.replace("\\", "/").split("/")
+    if parts == ["flow_definition.json"]:
+        return ROOT_FLOW_NAME
+    if parts[-1] == "definition.json":
+        return parts[-2]
+    return os.path.splitext(parts[-1])[0]
+
+
+def _load_flow(root: str, rel_path: str) -> FlowSource:
+    """Lee y valida una definición; lanza ValueError si no sirve."""
+    with open(os.path.join(root, rel_path), encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"JSON inválido: {exc}") from None
+    name = _flow_name(rel_path)
+    display = DISPLAY_NAMES.get(name, name)
+    # Exportaciones de la API de flujos: {"properties": {"definition": ...}}
+    props = data.get("properties") if isinstance(data, dict) else None
+    if isinstance(props, dict) and "definition" in props:
+        display = props.get("displayName") or display
+        data = props["definition"]
+    if not isinstance(data, dict) or "triggers" not in data or "actions" not in data:
+        raise ValueError("no es una definición de flujo (faltan triggers/actions)")
+    return FlowSource(name, rel_path, display, data)
+
+
+def discover_flows(root: str) -> tuple[List[FlowSource], List[str]]:
+    """Devuelve (flujos válidos, errores) de todas las rutas conocidas."""
+    flows: Dict[str, FlowSource] = {}
+    errors: List[str] = []
+    for pattern in FLOW_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            rel = os.path.relpath(path, root)
+            try:
+                flow = _load_flow(root, rel)
+            except (OSError, ValueError) as exc:
+                errors.append(f"{rel}: {exc}")
+                continue
+            prev = flows.get(flow.name)
+            if prev is None:
+                flows[flow.name] = flow
+            elif prev.digest() != flow.digest():
+                errors.append(f"{rel}: difiere de {prev.path} (se usa {prev.path})")
+    return list(flows.values()), errors
+
+
+# ---------- 4. Contenidos de los XML ----------
+def _content_types(flow: FlowSource) -> str:
+    return textwrap.dedent(f"""\
+        <?xml version="1.0" encoding="utf-8"?>
+        <Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+          <Default Extension="xml"  ContentType="application/xml"/>
+          <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+          <Override PartName="/Workflows/{flow.name}/definition.json" ContentType="application/json"/>
+        </Types>
+    """)
+
+
+def _solution_xml(flow: FlowSource) -> str:
+    return textwrap.dedent(f"""\
+        <?xml version="1.0" encoding="utf-8"?>
+        <ImportExportXml>
+          <SolutionManifest>
+            <UniqueName>{flow.name}_Solution</UniqueName>
+            <Version>{VERSION}</Version>
+            <Publisher>
+              <UniqueName>{PUBLISHER_UNAME}</UniqueName>
+              <Prefix>{PUBLISHER_PREF}</Prefix>
+            </Publisher>
+            <Managed>0</Managed>
+            <RootComponents>
+              <RootComponent type="29" id="{flow.guid}" />
+            </RootComponents>
+          </SolutionManifest>
+          <Workflows>
+            <Workflow path="Workflows/{flow.name}/definition.json" id="{flow.guid}" />
+          </Workflows>
+        </ImportExportXml>
+    """)
+
+
+def _customizations_xml(flow: FlowSource) -> str:
+    return textwrap.dedent(f"""\
+        <?xml version="1.0" encoding="utf-8"?>
+        <ImportExportXml>
+          <Workflows>
+            <Workflow>
+              <WorkflowId>{flow.guid}</WorkflowId>
+              <Name>{flow.name}</Name>
+              <DisplayName>{flow.display_name}</DisplayName>
+              <Category>5</Category>
+            </Workflow>
+          </Workflows>
+        </ImportExportXml>
+    """)
+
+
+# ---------- 5. Crear ZIP determinista ----------
+def build_zip(flow: FlowSource) -> bytes:
+    """ZIP con orden, fechas y permisos fijos: mismas entradas, mismos bytes."""
+    entries = [
+        ("[Content_Types].xml", _content_types(flow)),
+        ("solution.xml", _solution_xml(flow)),
+        ("Other/Customizations.xml", _customizations_xml(flow)),
+        (f"Workflows/{flow.name}/definition.json",
+         json.dumps(flow.definition, indent=2, ensure_ascii=False) + "\n"),
+    ]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, text in entries:
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 0
+            info.external_attr = 0o644 << 16
+            z.writestr(info, text.encode("utf-8"))
+    return buffer.getvalue()
+
+
+# ---------- 6. Compilación incremental ----------
+def _load_cache(out_dir: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(out_dir, CACHE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_all(root: str, out_dir: str, force: bool = False) -> tuple[List[str], List[str]]:
+    """Compila sólo las soluciones cuyo contenido cambió.
+
+    Devuelve (rutas de ZIP reconstruidos, errores de validación).
+    """
+    flows, errors = discover_flows(root)
+    os.makedirs(out_dir, exist_ok=True)
+    cache = _load_cache(out_dir)
+    built: List[str] = []
+    for flow in flows:
+        zip_path = os.path.join(out_dir, f"{flow.name}_Solution.zip")
+        digest = flow.digest()
+        if not force and cache.get(flow.name) == digest and os.path.exists(zip_path):
+            print(f"= {flow.name}: sin cambios")
+            continue
+        zip_bytes = build_zip(flow)
+        with open(zip_path, "wb") as f:
+            f.write(zip_bytes)
+        cache[flow.name] = digest
+        built.append(zip_path)
+        print(f"✅ ZIP escrito: {os.path.abspath(zip_path)}  ({len(zip_bytes)//1024} KB)")
+    with open(os.path.join(out_dir, CACHE_FILE), "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    return built, errors
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Empaqueta los flujos como soluciones")
+    parser.add_argument("--root", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--out", default="dist", help="Carpeta de salida (default: dist)")
+    parser.add_argument("--force", action="store_true", help="Reconstruir todo")
+    parser.add_argument("--base64", action="store_true", help="Imprimir los ZIP nuevos en Base-64")
+    args = parser.parse_args(argv)
+
+    built, errors = build_all(args.root, os.path.join(args.root, args.out), args.force)
+    for err in errors:
+        print(f"❌ {err}")
+    # ---------- 7. Imprimir Base-64 (opcional) ----------
+    if args.base64:
+        for path in built:
+            with open(path, "rb") as f:
+                print(f"\n--- {os.path.basename(path)} BASE64 ---")
+                print(base64.b64encode(f.read()).decode())
+        print("\n--- FIN ---")
+    return 1 if errors else 0
+
 
-# ---------- 3. Contenidos de los XML ----------
-content_types = textwrap.dedent("""\
-    <?xml version="1.0" encoding="utf-8"?>
-    <Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-      <Default Extension="xml"  ContentType="application/xml"/>
-      <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
-      <Override PartName="/Workflows/ActualizarStock_Compras/definition.json" ContentType="application/json"/>
-    </Types>
-""")
-
-solution_xml = textwrap.dedent(f"""\
-    <?xml version="1.0" encoding="utf-8"?>
-    <ImportExportXml>
-      <SolutionManifest>
-        <UniqueName>{SOLUTION_NAME}</UniqueName>
-        <Version>{VERSION}</Version>
-        <Publisher>
-          <UniqueName>{PUBLISHER_UNAME}</UniqueName>
-          <Prefix>{PUBLISHER_PREF}</Prefix>
-        </Publisher>
-        <Managed>0</Managed>
-        <RootComponents>
-          <RootComponent type="29" id="{FLOW_GUID}" />
-        </RootComponents>
-      </SolutionManifest>
-      <Workflows>
-        <Workflow path="Workflows/ActualizarStock_Compras/definition.json" id="{FLOW_GUID}" />
-      </Workflows>
-    </ImportExportXml>
-""")
-
-customizations_xml = textwrap.dedent(f"""\
-    <?xml version="1.0" encoding="utf-8"?>
-    <ImportExportXml>
-      <Workflows>
-        <Workflow>
-          <WorkflowId>{FLOW_GUID}</WorkflowId>
-          <Name>ActualizarStock_Compras</Name>
-          <DisplayName>{DISPLAY_NAME}</DisplayName>
-          <Category>5</Category>
-        </Workflow>
-      </Workflows>
-    </ImportExportXml>
-""")
-
-# ---------- 4. Crear ZIP en memoria ----------
-buffer = io.BytesIO()
-with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
-    z.writestr("[Content_Types].xml", content_types)
-    z.writestr("solution.xml",         solution_xml)
-    z.writestr("Other/Customizations.xml", customizations_xml)
-    z.writestr("Workflows/ActualizarStock_Compras/definition.json", json.dumps(json.loads(FLOW_JSON), indent=2))
-zip_bytes = buffer.getvalue()
-
-# ---------- 5. Guardar ZIP en disco ----------
-zip_filename = "ActualizarStock.zip"
-with open(zip_filename, "wb") as f:
-    f.write(zip_bytes)
-print(f"✅ ZIP escrito: {os.path.abspath(zip_filename)}  ({len(zip_bytes)//1024} KB)")
-
-# ---------- 6. Imprimir Base-64 (opcional) ----------
-b64 = base64.b64encode(zip_bytes).decode()
-print("\n--- ZIP BASE64 ---")
-print(b64)
-print("\n--- FIN ---")
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Offline cost estimate for Power Automate workflow definitions.
+
+Loads the same definitions packaged by ``build_solution.py``, builds the
+``runAfter`` graph of each flow and, for a purchase table of a given size,
+estimates:
+
+* connector calls per action (pagination included),
+* loop iterations,
+* the critical-path latency of one run and of a burst of files, taking the
+  trigger concurrency into account.
+
+Latencies are rough defaults meant to be tuned with ``--latency`` and
+``--per-item`` after measuring a real run.
+
+Example::
+
+    python flow_simulator.py --rows 12000 --files 3
+    python flow_simulator.py --rows 12000 --latency runActualizarStock=8 --per-item runActualizarStock=0.002
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from build_solution import FlowSource, discover_flows
+
+CONNECTOR_TYPES = {"ApiConnection", "OpenApiConnection", "ApiConnectionWebhook"}
+# Rows returned per page by the Excel connector when listing a table.
+DEFAULT_PAGE_SIZE = 256
+# Logic Apps runs up to 20 "Apply to each" iterations in parallel by default.
+DEFAULT_FOREACH_PARALLELISM = 20
+DEFAULT_CONNECTOR_LATENCY = 1.0
+DEFAULT_DATA_LATENCY = 0.05
+DEFAULT_UNTIL_ITERATIONS = 1
+
+
+@dataclass
+class ActionCost:
+    """Estimated cost of one action of a run."""
+
+    name: str
+    type: str
+    calls: int = 0
+    iterations: int = 1
+    items: int = 0
+    latency: float = 0.0
+    start: float = 0.0
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def finish(self) -> float:
+        return self.start + self.latency
+
+
+@dataclass
+class FlowEstimate:
+    """Cost of one flow run plus the graph needed to explain it."""
+
+    flow: str
+    actions: Dict[str, ActionCost]
+    critical_path: List[str]
+    trigger_concurrency: Optional[int]
+
+    @property
+    def calls(self) -> int:
+        return sum(a.calls for a in self.actions.values())
+
+    @property
+    def latency(self) -> float:
+        return max((a.finish for a in self.actions.values()), default=0.0)
+
+    def burst_latency(self, files: int) -> float:
+        """Wall time to process ``files`` triggers arriving together."""
+
+        slots = self.trigger_concurrency or files
+        return math.ceil(files / max(1, slots)) * self.latency
+
+
+class Simulator:
+    """Walks a workflow definition and accumulates estimated costs."""
+
+    def __init__(
+        self,
+        rows: int,
+        *,
+        latency: Optional[Dict[str, float]] = None,
+        per_item: Optional[Dict[str, float]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> None:
+        self.rows = rows
+        self.latency = latency or {}
+        self.per_item = per_item or {}
+        self.page_size = page_size
+
+    # -- per action --------------------------------------------------------
+
+    def _items_after_pagination(self, cost: ActionCost, inputs: dict) -> int:
+        rows = cost.items
+        limit = (inputs.get("paginationPolicy") or {}).get("minimumItemCount")
+        if limit is None:
+            cost.calls = 1
+            if rows > self.page_size:
+                cost.notes.append(f"sin paginación: sólo {self.page_size} filas")
+            return min(rows, self.page_size)
+        items = min(rows, int(limit))
+        cost.calls = max(1, math.ceil(items / self.page_size))
+        if rows > items:
+            cost.notes.append(f"minimumItemCount={limit}: se pierden {rows - items} filas")
+        return items
+
+    def _action(self, name: str, action: dict, items: int) -> ActionCost:
+        kind = action.get("type", "")
+        inputs = action.get("inputs") or {}
+        cost = ActionCost(name, kind, items=items)
+        per_item = self.per_item.get(name, 0.0) * items
+        if kind in CONNECTOR_TYPES:
+            base = self.latency.get(name, DEFAULT_CONNECTOR_LATENCY)
+            if isinstance(inputs, dict) and "paginationPolicy" in inputs:
+                # Rows dropped by the pagination limit never reach later actions.
+                cost.items = self._items_after_pagination(cost, inputs)
+            else:
+                cost.calls = 1
+            cost.latency = base * cost.calls + per_item
+        elif kind == "Foreach":
+            cost.iterations = items
+            inner = self._graph(action.get("actions") or {}, 1)
+            inner_latency = max((a.finish for a in inner.values()), default=0.0)
+            conc = (action.get("runtimeConfiguration") or {}).get("concurrency") or {}
+            parallel = int(conc.get("repetitions", DEFAULT_FOREACH_PARALLELISM))
+            cost.calls = items * sum(a.calls for a in inner.values())
+            cost.latency = math.ceil(items / max(1, parallel)) * inner_latency + per_item
+            cost.notes.append(f"{items} iteraciones, paralelismo {parallel}")
+        elif kind == "Until":
+            loops = DEFAULT_UNTIL_ITERATIONS
+            cost.iterations = loops
+            inner = self._graph(action.get("actions") or {}, items)
+            cost.calls = loops * sum(a.calls for a in inner.values())
+            cost.latency = loops * max((a.finish for a in inner.values()), default=0.0)
+        elif kind in {"If", "Scope", "Switch"}:
+            branches = [action.get("actions") or {}]
+            branches.append((action.get("else") or {}).get("actions") or {})
+            branches.extend((c.get("actions") or {}) for c in (action.get("cases") or {}).values())
+            branches.append((action.get("default") or {}).get("actions") or {})
+            # The most expensive branch bounds the run.
+            worst = max(
+                (self._graph(b, items) for b in branches if b),
+                key=lambda g: max((a.finish for a in g.values()), default=0.0),
+                default={},
+            )
+            cost.calls = sum(a.calls for a in worst.values())
+            cost.latency = max((a.finish for a in worst.values()), default=0.0)
+        else:
+            cost.latency = self.latency.get(name, DEFAULT_DATA_LATENCY) + per_item
+        return cost
+
+    # -- graph -------------------------------------------------------------
+
+    def _graph(self, actions: Dict[str, dict], items: int) -> Dict[str, ActionCost]:
+        """Schedule ``actions`` as early as their ``runAfter`` allows."""
+
+        costs: Dict[str, ActionCost] = {}
+        pending = dict(actions)
+        while pending:
+            ready = [
+                n for n, a in pending.items()
+                if all(dep in costs or dep not in actions for dep in (a.get("runAfter") or {}))
+            ]
+            if not ready:
+                raise ValueError(f"Ciclo en runAfter: {', '.join(sorted(pending))}")
+            for name in sorted(ready):
+                action = pending.pop(name)
+                deps = [d for d in (action.get("runAfter") or {}) if d in costs]
+                cost = self._action(name, action, min((costs[d].items for d in deps), default=items))
+                cost.start = max((costs[d].finish for d in deps), default=0.0)
+                costs[name] = cost
+        return costs
+
+    def estimate(self, flow: FlowSource) -> FlowEstimate:
+        definition = flow.definition
+        triggers = definition.get("triggers") or {}
+        trigger_concurrency = None
+        costs: Dict[str, ActionCost] = {}
+        for name, trig in triggers.items():
+            cost = ActionCost(name, trig.get("type", ""))
+            if cost.type in CONNECTOR_TYPES:
+                cost.calls = 1
+            conc = ((trig.get("runtimeConfiguration") or {}).get("concurrency") or {})
+            count = (conc.get("repetition") or {}).get("count")
+            if count is not None:
+                trigger_concurrency = int(count)
+            costs[name] = cost
+
+        # Top-level actions reference the trigger in runAfter; treat it as done.
+        actions = definition.get("actions") or {}
+        graph = self._graph(
+            {n: {**a, "runAfter": {d: s for d, s in (a.get("runAfter") or {}).items() if d not in triggers}}
+             for n, a in actions.items()},
+            self.rows,
+        )
+        costs.update(graph)
+        return FlowEstimate(flow.name, costs, _critical_path(actions, graph), trigger_concurrency)
+
+
+def _critical_path(actions: Dict[str, dict], costs: Dict[str, ActionCost]) -> List[str]:
+    if not costs:
+        return []
+    name = max(costs, key=lambda n: costs[n].finish)
+    path = [name]
+    while True:
+        deps = [d for d in (actions[name].get("runAfter") or {}) if d in costs]
+        if not deps:
+            break
+        name = max(deps, key=lambda d: costs[d].finish)
+        path.append(name)
+    return path[::-1]
+
+
+# ---------------------------------------------------------------------------
+# Example CLI
+# ---------------------------------------------------------------------------
+
+
+def _parse_pairs(values: List[str]) -> Dict[str, float]:
+    result: Dict[str, float] = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        result[name] = float(seconds)
+    return result
+
+
+def _report(est: FlowEstimate, files: int) -> None:
+    print(f"\n== {est.flow} ==")
+    print(f"{'acción':<28}{'tipo':<22}{'llamadas':>9}{'iter':>7}{'inicio':>9}{'dur (s)':>9}")
+    for a in sorted(est.actions.values(), key=lambda a: (a.start, a.name)):
+        print(f"{a.name:<28}{a.type:<22}{a.calls:>9}{a.iterations:>7}{a.start:>9.2f}{a.latency:>9.2f}")
+        for note in a.notes:
+            print(f"    ⚠ {note}")
+    print(f"Llamadas a conectores por ejecución: {est.calls}")
+    print(f"Ruta crítica: {' -> '.join(est.critical_path)} ({est.latency:.2f} s)")
+    if files > 1:
+        print(
+            f"{files} archivos (concurrencia del trigger {est.trigger_concurrency or 'sin límite'}): "
+            f"{est.calls * files} llamadas, {est.burst_latency(files):.2f} s"
+        )
+
+
+def main() -> None:  # pragma: no cover - CLI helper
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Estima el costo de los flujos")
+    parser.add_argument("--rows", type=int, required=True, help="Filas del archivo de compras")
+    parser.add_argument("--files", type=int, default=1, help="Archivos que llegan juntos")
+    parser.add_argument("--flow", help="Simular sólo este flujo")
+    parser.add_argument("--root", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument(
+        "--latency", action="append", default=[], metavar="ACCION=SEG",
+        help="Latencia por llamada de una acción",
+    )
+    parser.add_argument(
+        "--per-item", action="append", default=[], metavar="ACCION=SEG",
+        help="Costo adicional por fila procesada en una acción",
+    )
+    args = parser.parse_args()
+
+    flows, errors = discover_flows(args.root)
+    for err in errors:
+        print(f"❌ {err}")
+    sim = Simulator(
+        args.rows,
+        latency=_parse_pairs(args.latency),
+        per_item=_parse_pairs(args.per_item),
+        page_size=args.page_size,
+    )
+    for flow in flows:
+        if args.flow and flow.name != args.flow:
+            continue
+        _report(sim.estimate(flow), args.files)
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI
+    main()
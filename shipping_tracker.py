@@ -13,27 +13,204 @@ It was adapted from a larger script with several improvements:
 
 from __future__ import annotations
 
+import cProfile
+import functools
+import itertools
+import json
+import math
 import os
+import pstats
 import re
+import sys
+import threading
 import time
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Iterable, List, Optional
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait as wait_futures
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import pandas as pd
 import pdfplumber
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from pdfminer.psparser import PSException
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+try:  # pdfplumber >= 0.11 wraps pdfminer errors in its own exception
+    from pdfplumber.utils.exceptions import PdfminerException
+except ImportError:  # pragma: no cover - older pdfplumber
+    PdfminerException = PSException
+
+# ---------------------------------------------------------------------------
+# Tracing and profiling
+# ---------------------------------------------------------------------------
+
+
+class Tracer:
+    """Collect stage spans as Chrome trace events (one track per thread).
+
+    The resulting file opens in ``chrome://tracing`` or Perfetto.
+    """
+
+    def __init__(self) -> None:
+        self._events: List[dict] = []
+        self._tids: Dict[object, int] = {}
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        # Same instant on the wall clock, for spans measured in other processes.
+        self._wall0 = time.time()
+        self._pid = os.getpid()
+
+    def _tid(self, key: object = None, name: Optional[str] = None) -> int:
+        """Track of the current thread, or of ``key`` (e.g. a worker process)."""
+
+        if key is None:
+            key, name = threading.get_ident(), threading.current_thread().name
+        tid = self._tids.get(key)
+        if tid is None:
+            tid = self._tids[key] = len(self._tids) + 1
+            self._events.append({
+                "name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                "args": {"name": name},
+            })
+        return tid
+
+    def add(self, name: str, start: float, end: float, track: str, **args: object) -> None:
+        """Add a span measured elsewhere, with ``time.time()`` bounds, to ``track``."""
+
+        with self._lock:
+            self._events.append({
+                "name": name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": (start - self._wall0) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": self._tid(("track", track), track),
+                "args": {k: str(v) for k, v in args.items()},
+            })
+
+    @contextmanager
+    def span(self, name: str, **args: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._events.append({
+                    "name": name,
+                    "cat": "stage",
+                    "ph": "X",
+                    "ts": (start - self._t0) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": self._pid,
+                    "tid": self._tid(),
+                    "args": {k: str(v) for k, v in args.items()},
+                })
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            events = list(self._events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Set by ``main()`` when ``--trace`` is given; spans are free otherwise.
+_TRACER: Optional[Tracer] = None
+
+
+def _span(name: str, **args: object):
+    """Return a tracing span for ``name``, or a no-op when tracing is off."""
+
+    return _TRACER.span(name, **args) if _TRACER is not None else nullcontext()
+
+
+def _sleep(seconds: float) -> None:
+    """``time.sleep`` that shows up as its own stage in traces."""
+
+    with _span("sleep", seconds=seconds):
+        time.sleep(seconds)
+
+
+# Functions whose callees make up each traced stage, for ``--profile``.
+_STAGE_FUNCTIONS = {
+    "read_excel": r"read_excel|load_workbook|_iter_excel_chunks",
+    "extract_table": r"extract_table|find_table|TableLayout",
+    "driver_get": r"webdriver\.py:\d+\(get\)",
+    "sleep": r"_sleep",
+    "2captcha": r"_solve_captcha",
+    "to_excel": r"to_excel",
+}
+
+
+class RunProfiler:
+    """cProfile over a whole run, lookup worker threads included.
+
+    Before Python 3.12 a profiler only sees the thread that enabled it, so
+    ``thread_initializer`` must be passed to the worker pools; from 3.12 on
+    cProfile already covers every thread.
+    """
+
+    def __init__(self) -> None:
+        self._main = cProfile.Profile()
+        self._threads: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self._main.enable()
+
+    def thread_initializer(self) -> None:
+        if sys.version_info >= (3, 12):
+            return
+        prof = cProfile.Profile()
+        prof.enable()
+        with self._lock:
+            self._threads.append(prof)
+
+    def write(self, directory: str) -> None:
+        """Write ``run.prof`` and one text report per stage to ``directory``."""
+
+        self._main.disable()
+        os.makedirs(directory, exist_ok=True)
+        stats = pstats.Stats(self._main)
+        for prof in self._threads:
+            prof.create_stats()
+            stats.add(prof)
+        run_path = os.path.join(directory, "run.prof")
+        stats.dump_stats(run_path)
+        for stage, pattern in _STAGE_FUNCTIONS.items():
+            with open(os.path.join(directory, f"{stage}.txt"), "w", encoding="utf-8") as f:
+                report = pstats.Stats(run_path, stream=f).sort_stats("cumulative")
+                report.print_stats(pattern)
+                report.print_callees(pattern)
+
+
 # ---------------------------------------------------------------------------
 # Data structures
 # ---------------------------------------------------------------------------
 
+# Columns of the results workbook, in the order of ``Shipment`` fields.
+RESULT_COLUMNS = [
+    "Tipo",
+    "Numero de Seguimiento/Orden",
+    "Consignatario/Destinatario",
+    "Compañía de Envío",
+    "Referencia",
+    "Estado",
+]
+
+
 @dataclass
 class Shipment:
     """Simple container for shipping information."""
@@ -46,71 +223,344 @@ class Shipment:
     status: str = ""
 
 
+@dataclass(frozen=True)
+class TrackingEvent:
+    """A single dated tracking event reported by a carrier."""
+
+    timestamp: datetime
+    carrier: str
+    raw: str
+    state: str
+
+
+# ---------------------------------------------------------------------------
+# Event history
+# ---------------------------------------------------------------------------
+
+# Normalized states, checked in order: the first matching keyword wins.
+_STATE_KEYWORDS = [
+    ("error", ["ERROR"]),
+    # Before "entregado": "No entregado" contains "ENTREGAD".
+    ("no_entregado", ["NO ENTREGAD"]),
+    ("entregado", ["ENTREGAD"]),
+    ("en_reparto", ["REPARTO"]),
+    ("en_sucursal", ["SUCURSAL"]),
+    ("en_transito", ["TRANSITO", "TRÁNSITO", "DESPACHAD", "RUTA"]),
+    ("recibido", ["RECIBID", "ADMITID"]),
+    ("creado", ["CREAD", "EMITID"]),
+    ("sin_informacion", ["NO REGISTRA", "NO DISPONIBLE", "NO SE DETECT"]),
+]
+
+
+def normalize_state(text: str) -> str:
+    """Map a free-form carrier status to a small set of normalized states."""
+
+    upper = (text or "").upper()
+    for state, keywords in _STATE_KEYWORDS:
+        if any(k in upper for k in keywords):
+            return state
+    return "desconocido"
+
+
+class EventHistory:
+    """Append-only per-shipment event store backed by a JSON lines file.
+
+    Each line holds ``[tracking, timestamp, carrier, raw, state]``.  Events are
+    only written when they have not been seen before for that shipment, so
+    the file can be re-fed with the full carrier timeline on every run.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._events: Dict[str, List[TrackingEvent]] = {}
+        self._seen: Set[Tuple[str, datetime, str]] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    tracking, ts, carrier, raw, state = json.loads(line)
+                    self._remember(
+                        tracking,
+                        TrackingEvent(datetime.fromisoformat(ts), carrier, raw, state),
+                    )
+
+    def _remember(self, tracking: str, event: TrackingEvent) -> bool:
+        key = (tracking, event.timestamp, event.raw)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        self._events.setdefault(tracking, []).append(event)
+        return True
+
+    def events(self, tracking: str) -> List[TrackingEvent]:
+        """Return the stored events of ``tracking`` in chronological order."""
+
+        return sorted(self._events.get(tracking, []), key=lambda e: e.timestamp)
+
+    def last(self, tracking: str) -> Optional[TrackingEvent]:
+        events = self.events(tracking)
+        return events[-1] if events else None
+
+    def add(self, tracking: str, events: Iterable[TrackingEvent]) -> int:
+        """Append the events not stored yet and return how many were new."""
+
+        with self._lock:
+            new = [e for e in events if self._remember(tracking, e)]
+            if new:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for e in new:
+                        f.write(json.dumps(
+                            [tracking, e.timestamp.isoformat(), e.carrier, e.raw, e.state],
+                            ensure_ascii=False,
+                        ) + "\n")
+        return len(new)
+
+    def observe(self, shipment: Shipment, when: Optional[datetime] = None) -> int:
+        """Record the current status of ``shipment`` if it changed.
+
+        Carriers that only expose a single status string have no event date,
+        so the observation time is used instead.
+        """
+
+        state = normalize_state(shipment.status)
+        if not shipment.status or state == "error":
+            return 0
+        last = self.last(shipment.tracking_number)
+        if last is not None and last.raw == shipment.status:
+            return 0
+        event = TrackingEvent(
+            when or datetime.now().replace(microsecond=0),
+            shipment.carrier,
+            shipment.status,
+            state,
+        )
+        return self.add(shipment.tracking_number, [event])
+
+    def transit_time(self, tracking: str) -> Optional[timedelta]:
+        """Return the time between the first event and delivery, if known."""
+
+        events = self.events(tracking)
+        delivered = next((e for e in events if e.state == "entregado"), None)
+        if not events or delivered is None:
+            return None
+        return delivered.timestamp - events[0].timestamp
+
+
 # ---------------------------------------------------------------------------
 # Parsing utilities
 # ---------------------------------------------------------------------------
 
 
-def _load_table_from_excel(path: str, headers: Iterable[str]) -> Optional[pd.DataFrame]:
-    """Return a table whose first row matches ``headers`` (case insensitive)."""
+# Header rows that identify each carrier's Excel manifest.
+STARKEN_HEADER_SETS = [
+    ["ORDEN DE TRANSPORTE", "DESTINATARIO"],
+    ["ORDEN TRANSPORTE", "DESTINATARIO"],
+    ["NUMERO DE SEGUIMIENTO", "DESTINATARIO"],
+]
+CRUZ_DEL_SUR_HEADERS = ["ORDEN TRANSPORTE", "DESTINATARIO"]
+# Header row of the Correos de Chile PDF manifest table.
+CORREOS_CHILE_HEADERS = ["DESTINATARIO", "REFERENCIA", "SEGUIMIENTO"]
 
-    df = pd.read_excel(path, header=None)
-    headers_up = [h.upper() for h in headers]
-    for idx, row in df.iterrows():
-        row_values = [str(v).strip().upper() for v in row]
-        if all(h in row_values for h in headers_up):
-            table = df.iloc[idx + 1 :].copy()
-            table.columns = row_values
-            return table.reset_index(drop=True)
-    return None
+# Rows handed to the consumer at a time when streaming Excel manifests.
+EXCEL_CHUNK_SIZE = 500
+
+
+def _cell_text(value: object) -> str:
+    """Return a cell as stripped text; empty cells and NaN become ``""``."""
+
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        if value.is_integer():
+            value = int(value)
+    return str(value).strip()
+
+
+def _iter_excel_values(path: str, nrows: Optional[int] = None) -> Iterator[tuple]:
+    """Stream the rows of the first sheet of ``path`` as value tuples.
+
+    ``nrows`` limits reading to the first rows, also for legacy ``.xls``.
+    """
+
+    if path.lower().endswith(".xls"):
+        # openpyxl cannot stream the legacy format; read it whole.
+        with _span("read_excel", path=path):
+            df = pd.read_excel(path, header=None, nrows=nrows)
+        yield from df.itertuples(index=False, name=None)
+        return
+    with _span("read_excel", path=path):
+        wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(max_row=nrows, values_only=True)
+    finally:
+        wb.close()
+
+
+def _iter_excel_chunks(
+    path: str,
+    header_sets: Iterable[Iterable[str]],
+    chunk_size: int = EXCEL_CHUNK_SIZE,
+) -> Iterator[List[Dict[str, str]]]:
+    """Yield chunks of the rows below the first row matching a header set.
+
+    Rows are dicts keyed by the upper-cased header.  The sheet is streamed,
+    so memory depends on ``chunk_size`` and not on the size of the file.
+    """
+
+    rows = _iter_excel_values(path)
+    header_sets = [[h.upper() for h in hs] for hs in header_sets]
+    header = None
+    for values in rows:
+        cells = [_cell_text(v).upper() for v in values]
+        if any(all(h in cells for h in hs) for hs in header_sets):
+            header = cells
+            break
+    if header is None:
+        print(f"❌ No se encontraron encabezados válidos en: {path}")
+        return
+    while True:
+        # The span covers reading only, not the consumer of the chunk.
+        with _span("read_excel_chunk", path=path):
+            chunk = [
+                {h: _cell_text(v) for h, v in zip(header, values)}
+                for values in itertools.islice(rows, chunk_size)
+            ]
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_starken_excel(path: str, *, chunk_size: int = EXCEL_CHUNK_SIZE) -> Iterator[Shipment]:
+    """Yield Starken shipments from an Excel file as it is read."""
+
+    for chunk in _iter_excel_chunks(path, STARKEN_HEADER_SETS, chunk_size):
+        columns = list(chunk[0])
+        col_order = next(c for c in columns if "ORDEN" in c or "NUMERO" in c)
+        col_dest = next(c for c in columns if "DESTINATARIO" in c)
+        for row in chunk:
+            if row.get(col_order, "").lower() not in {"", "nan"}:
+                yield Shipment("Starken", row[col_order], row.get(col_dest, ""), "Starken")
 
 
 def extract_starken_excel(path: str) -> List[Shipment]:
     """Parse Starken shipments from an Excel file."""
 
-    header_sets = [
-        ["ORDEN DE TRANSPORTE", "DESTINATARIO"],
-        ["ORDEN TRANSPORTE", "DESTINATARIO"],
-        ["NUMERO DE SEGUIMIENTO", "DESTINATARIO"],
-    ]
-    for headers in header_sets:
-        df = _load_table_from_excel(path, headers)
-        if df is None:
-            continue
-        col_order = next(c for c in df.columns if "ORDEN" in c or "NUMERO" in c)
-        col_dest = next(c for c in df.columns if "DESTINATARIO" in c)
-        return [
-            Shipment(
-                "Starken",
-                str(row.get(col_order, "")).strip(),
-                str(row.get(col_dest, "")).strip(),
-                "Starken",
-            )
-            for _, row in df.iterrows()
-            if str(row.get(col_order, "")).strip().lower() not in {"", "nan"}
-        ]
-    print(f"❌ No se encontraron encabezados válidos en: {path}")
-    return []
-
+    return list(iter_starken_excel(path))
 
-def extract_fedex_pdf(path: str) -> List[Shipment]:
-    """Parse FedEx shipments from a PDF."""
 
-    shipments: List[Shipment] = []
+@dataclass
+class TableLayout:
+    """Column boundaries and header of a manifest table, learned once.
+
+    Every page of a carrier manifest has the same layout, so after the first
+    full table detection the remaining pages are cropped to the table and
+    read with explicit vertical lines, skipping pdfplumber's edge search.
+    """
+
+    x0: float
+    x1: float
+    columns: List[float]
+    header: List[str]
+
+    @classmethod
+    def learn(cls, page) -> Optional[Tuple["TableLayout", List[List[Optional[str]]]]]:
+        """Detect the table of ``page`` and return its layout and rows."""
+
+        found = page.find_table()
+        if found is None:
+            return None
+        rows = found.extract()
+        if not rows:
+            return None
+        xs = sorted({round(c[0], 2) for c in found.cells} | {round(c[2], 2) for c in found.cells})
+        layout = cls(found.bbox[0], found.bbox[2], xs, _header(rows[0]))
+        return layout, rows
+
+    def extract(self, page) -> Optional[List[List[Optional[str]]]]:
+        """Extract the table of ``page`` using the learned columns."""
+
+        x0 = max(self.x0 - 1, page.bbox[0])
+        x1 = min(self.x1 + 1, page.bbox[2])
+        region = page.crop((x0, page.bbox[1], x1, page.bbox[3]))
+        table = region.extract_table({
+            "vertical_strategy": "explicit",
+            "explicit_vertical_lines": self.columns,
+            "horizontal_strategy": "lines",
+        })
+        if not table or any(len(r) != len(self.columns) - 1 for r in table):
+            return None
+        return table
+
+
+# Cheap per-page check: a page without a tracking-like number has no rows.
+_TRACKING_PROBE = re.compile(r"\d{8,}")
+
+
+def _header(row: Iterable[Optional[str]]) -> List[str]:
+    return [(c or "").strip().upper() for c in row]
+
+
+def _iter_pdf_tables(
+    path: str, carrier: str, learn_layout: bool = False
+) -> Iterator[Tuple[List[str], List[List[Optional[str]]]]]:
+    """Yield ``(header, rows)`` for every page of ``path`` with a table.
+
+    Without ``learn_layout`` every page runs the full table detection and
+    its first row is the header.  With it, the layout is learned on the
+    first table of the document and reused on its later pages; pages whose
+    text has no tracking-like number are skipped without any table
+    detection.  Layouts are not shared between documents, since two
+    manifests of the same carrier can have different column widths.
+    """
+
+    layout: Optional[TableLayout] = None
     with pdfplumber.open(path) as pdf:
         for page in pdf.pages:
-            table = page.extract_table()
-            if not table:
+            if not learn_layout:
+                with _span("extract_table", page=page.page_number):
+                    table = page.extract_table()
+                if table:
+                    yield _header(table[0]), table[1:]
                 continue
-            for row in table[1:]:
-                if len(row) >= 3 and row[0] and row[2]:
-                    tracking = row[0].strip()
-                    consignee = row[2].strip().split("\n")[0]
-                    if tracking.isdigit() and len(tracking) >= 8:
-                        shipments.append(
-                            Shipment("FedEx", tracking, consignee, "FedEx")
-                        )
-    return shipments
+            if layout is not None:
+                if not _TRACKING_PROBE.search("".join(c["text"] for c in page.chars)):
+                    continue
+                with _span("extract_table", page=page.page_number, carrier=carrier, layout=True):
+                    table = layout.extract(page)
+                # The page has a tracking number, so a fitting table shows it.
+                if table is not None and any(_TRACKING_PROBE.search(c or "") for r in table for c in r):
+                    # Repeated headers on each page are dropped, not parsed.
+                    yield layout.header, [r for r in table if _header(r) != layout.header]
+                    continue
+            # First page or layout mismatch: detect and (re)learn the layout.
+            with _span("extract_table", page=page.page_number, carrier=carrier, learn=True):
+                learned = TableLayout.learn(page)
+            if learned is None:
+                continue
+            layout, rows = learned
+            yield layout.header, rows[1:]
+
+
+def iter_fedex_pdf(path: str, *, learn_layout: bool = False) -> Iterator[Shipment]:
+    """Yield FedEx shipments from a PDF page by page."""
+
+    for _header_row, rows in _iter_pdf_tables(path, "FedEx", learn_layout):
+        for row in rows:
+            if len(row) >= 3 and row[0] and row[2]:
+                tracking = row[0].strip()
+                consignee = row[2].strip().split("\n")[0]
+                if tracking.isdigit() and len(tracking) >= 8:
+                    yield Shipment("FedEx", tracking, consignee, "FedEx")
+
+
+def extract_fedex_pdf(path: str, *, learn_layout: bool = False) -> List[Shipment]:
+    """Parse FedEx shipments from a PDF."""
+
+    return list(iter_fedex_pdf(path, learn_layout=learn_layout))
 
 
 def _reference_ok(text: str) -> bool:
@@ -118,52 +568,152 @@ def _reference_ok(text: str) -> bool:
     return any(c.startswith("36") for c in codes)
 
 
-def extract_correos_chile_pdf(path: str) -> List[Shipment]:
-    """Parse Correos de Chile manifests from a PDF."""
+def iter_correos_chile_pdf(path: str, *, learn_layout: bool = False) -> Iterator[Shipment]:
+    """Yield Correos de Chile shipments from a PDF page by page."""
 
-    shipments: List[Shipment] = []
-    with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table()
-            if not table:
-                continue
-            headers = [c.strip().upper() for c in table[0]]
-            try:
-                idx_dest = headers.index("DESTINATARIO")
-                idx_ref = headers.index("REFERENCIA")
-                idx_track = headers.index("SEGUIMIENTO")
-            except ValueError:
+    for headers, rows in _iter_pdf_tables(path, "Correos de Chile", learn_layout):
+        try:
+            idx_dest, idx_ref, idx_track = (headers.index(h) for h in CORREOS_CHILE_HEADERS)
+        except ValueError:
+            continue
+        for row in rows:
+            if len(row) <= max(idx_dest, idx_ref, idx_track):
                 continue
-            for row in table[1:]:
-                if len(row) <= max(idx_dest, idx_ref, idx_track):
-                    continue
-                dest = row[idx_dest].strip()
-                ref = row[idx_ref].strip()
-                track = row[idx_track].strip()
-                if _reference_ok(ref) and track.isdigit():
-                    shipments.append(
-                        Shipment("Correos de Chile", track, dest, "Correos de Chile", ref)
-                    )
-    return shipments
+            dest = (row[idx_dest] or "").strip()
+            ref = (row[idx_ref] or "").strip()
+            track = (row[idx_track] or "").strip()
+            if _reference_ok(ref) and track.isdigit():
+                yield Shipment("Correos de Chile", track, dest, "Correos de Chile", ref)
+
+
+def extract_correos_chile_pdf(path: str, *, learn_layout: bool = False) -> List[Shipment]:
+    """Parse Correos de Chile manifests from a PDF."""
+
+    return list(iter_correos_chile_pdf(path, learn_layout=learn_layout))
+
+
+def iter_cruz_del_sur_excel(path: str, *, chunk_size: int = EXCEL_CHUNK_SIZE) -> Iterator[Shipment]:
+    """Yield Cruz del Sur shipments from an Excel file as it is read."""
+
+    for chunk in _iter_excel_chunks(path, [CRUZ_DEL_SUR_HEADERS], chunk_size):
+        for row in chunk:
+            tracking = row.get("ORDEN TRANSPORTE", "")
+            if tracking.lower() not in {"", "nan"}:
+                yield Shipment("Cruz del Sur", tracking, row.get("DESTINATARIO", ""), "Cruz del Sur")
 
 
 def extract_cruz_del_sur_excel(path: str) -> List[Shipment]:
     """Parse Cruz del Sur shipments from an Excel file."""
 
-    df = _load_table_from_excel(path, ["ORDEN TRANSPORTE", "DESTINATARIO"])
-    if df is None:
-        print(f"❌ No se encontraron encabezados válidos en: {path}")
-        return []
-    return [
-        Shipment(
-            "Cruz del Sur",
-            str(row.get("ORDEN TRANSPORTE", "")).strip(),
-            str(row.get("DESTINATARIO", "")).strip(),
-            "Cruz del Sur",
-        )
-        for _, row in df.iterrows()
-        if str(row.get("ORDEN TRANSPORTE", "")).strip().lower() not in {"", "nan"}
-    ]
+    return list(iter_cruz_del_sur_excel(path))
+
+
+# Rows of a sheet inspected when sniffing its carrier.
+SNIFF_ROWS = 30
+
+
+def _carrier_from_name(path: str) -> Optional[str]:
+    """Carrier suggested by the file name, as the CLI used to decide."""
+
+    lower = os.path.basename(path).lower()
+    if lower.endswith(".pdf"):
+        if "fedex" in lower:
+            return "FedEx"
+        if "manifiesto" in lower or "correos" in lower:
+            return "Correos de Chile"
+    elif lower.endswith((".xlsx", ".xls")):
+        if "cruz" in lower:
+            return "Cruz del Sur"
+        if "starken" in lower:
+            return "Starken"
+    return None
+
+
+# Errors of files that cannot be read as a PDF or a workbook at all.
+MANIFEST_READ_ERRORS = (
+    OSError,
+    KeyError,
+    ValueError,
+    zipfile.BadZipFile,
+    InvalidFileException,
+    PSException,
+    PdfminerException,
+)
+
+
+def sniff_carrier(path: str) -> Optional[str]:
+    """Classify a manifest by its content, reading as little as possible.
+
+    PDFs are classified from the text of their first page and sheets from
+    their first ``SNIFF_ROWS`` rows, using the same header signatures as the
+    extractors.  The file name only breaks ties between carriers whose
+    headers are identical; ``None`` means the file is not a known manifest.
+    """
+
+    lower = path.lower()
+    hint = _carrier_from_name(path)
+    if lower.endswith(".pdf"):
+        with _span("sniff", path=path), pdfplumber.open(path) as pdf:
+            text = (pdf.pages[0].extract_text() or "").upper() if pdf.pages else ""
+        if all(h in text for h in CORREOS_CHILE_HEADERS):
+            return "Correos de Chile"
+        if "FEDEX" in text or "TNT" in text:
+            return "FedEx"
+        return hint
+    if not lower.endswith((".xlsx", ".xls")):
+        return None
+    with _span("sniff", path=path):
+        rows = [[_cell_text(v).upper() for v in r] for r in _iter_excel_values(path, SNIFF_ROWS)]
+    text = " ".join(c for r in rows for c in r)
+    for cells in rows:
+        starken = [hs for hs in STARKEN_HEADER_SETS if all(h in cells for h in hs)]
+        if not starken:
+            continue
+        if starken != [CRUZ_DEL_SUR_HEADERS]:
+            return "Starken"
+        # "ORDEN TRANSPORTE" + "DESTINATARIO" is used by both carriers.
+        if "STARKEN" in text:
+            return "Starken"
+        if "CRUZ DEL SUR" in text:
+            return "Cruz del Sur"
+        return hint if hint in {"Starken", "Cruz del Sur"} else "Cruz del Sur"
+    return None
+
+
+def iter_shipments(
+    path: str,
+    *,
+    learn_layout: bool = False,
+    chunk_size: int = EXCEL_CHUNK_SIZE,
+) -> Iterator[Shipment]:
+    """Yield the shipments of any supported manifest as they are parsed.
+
+    The extractor is chosen by ``sniff_carrier`` from the file content;
+    files that are not manifests, or cannot be read, yield nothing.
+    """
+
+    if os.path.basename(path).startswith("~$"):
+        return  # lock file of a workbook open in Excel
+    try:
+        carrier = sniff_carrier(path)
+    except MANIFEST_READ_ERRORS as exc:
+        print(f"⚠ No se pudo leer {os.path.basename(path)}: {exc}")
+        return
+    if carrier is None:
+        if path.lower().endswith((".pdf", ".xlsx", ".xls")):
+            print(f"⚠ No se reconoce el manifiesto: {os.path.basename(path)}")
+        return
+    hint = _carrier_from_name(path)
+    if hint is not None and hint != carrier:
+        print(f"⚠ {os.path.basename(path)} parece de {hint} pero su contenido es de {carrier}")
+    if carrier == "FedEx":
+        yield from iter_fedex_pdf(path, learn_layout=learn_layout)
+    elif carrier == "Correos de Chile":
+        yield from iter_correos_chile_pdf(path, learn_layout=learn_layout)
+    elif carrier == "Cruz del Sur":
+        yield from iter_cruz_del_sur_excel(path, chunk_size=chunk_size)
+    elif carrier == "Starken":
+        yield from iter_starken_excel(path, chunk_size=chunk_size)
 
 
 # ---------------------------------------------------------------------------
@@ -171,8 +721,29 @@ def extract_cruz_del_sur_excel(path: str) -> List[Shipment]:
 # ---------------------------------------------------------------------------
 
 
+def _make_http_client() -> requests.Session:
+    """Session with pooled connections and retries on transient errors."""
+
+    session = requests.Session()
+    retry = Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "Mozilla/5.0 (X11; Linux x86_64) shipping_tracker"
+    return session
+
+
+# Shared by every HTTP lookup so connections are reused across shipments.
+HTTP = _make_http_client()
+
+
 def _simple_soup_get(url: str, timeout: int = 15) -> BeautifulSoup:
-    r = requests.get(url, timeout=timeout)
+    r = HTTP.get(url, timeout=timeout)
     r.raise_for_status()
     return BeautifulSoup(r.text, "html.parser")
 
@@ -215,14 +786,96 @@ def status_correos_chile(tracking_number: str) -> str:
 # ---------------------------------------------------------------------------
 
 
+def _extension_patterns(*extensions: str) -> List[str]:
+    """``Network.setBlockedURLs`` patterns for files with ``extensions``.
+
+    A pattern only matches the whole URL, so ``logo.png?v=3`` needs its own
+    ``*.png?*`` entry.
+    """
+
+    return [p for ext in extensions for p in (f"*.{ext}", f"*.{ext}?*")]
+
+
+# URL patterns blocked through DevTools, by resource category.  The
+# "analytics" category is a fixed list of known tracking hosts, not a
+# block of every host other than the carrier's: DevTools URL patterns
+# cannot express "any other origin", and the carrier pages' own CDN and
+# data hosts are not known well enough to allow-list them safely.
+BLOCKED_URL_PATTERNS = {
+    "images": _extension_patterns("png", "jpg", "jpeg", "gif", "webp", "svg", "ico"),
+    "media": _extension_patterns("mp4", "webm", "mp3", "ogg", "m3u8"),
+    "fonts": _extension_patterns("woff", "woff2", "ttf", "otf", "eot"),
+    "analytics": [
+        "*google-analytics.com*",
+        "*googletagmanager.com*",
+        "*doubleclick.net*",
+        "*facebook.net*",
+        "*facebook.com/tr*",
+        "*hotjar.com*",
+        "*clarity.ms*",
+        "*youtube.com*",
+    ],
+}
+
+
+@dataclass(frozen=True)
+class BrowserProfile:
+    """Settings of the headless Chrome used by the lookups."""
+
+    width: int = 1920
+    height: int = 1080
+    page_load_strategy: str = "normal"
+    block: Tuple[str, ...] = ()
+    disable_gpu: bool = False
+    disable_extensions: bool = False
+
+    @property
+    def blocked_urls(self) -> List[str]:
+        return [p for category in self.block for p in BLOCKED_URL_PATTERNS[category]]
+
+
+FULL_PROFILE = BrowserProfile()
+LEAN_PROFILE = BrowserProfile(
+    width=1280,
+    height=800,
+    page_load_strategy="eager",
+    block=tuple(BLOCKED_URL_PATTERNS),
+    disable_gpu=True,
+    disable_extensions=True,
+)
+
+
+def browser_profile() -> BrowserProfile:
+    """Profile selected by ``TRACKER_BROWSER_PROFILE`` (``lean`` or ``full``)."""
+
+    name = os.environ.get("TRACKER_BROWSER_PROFILE", "lean").lower()
+    return FULL_PROFILE if name == "full" else LEAN_PROFILE
+
+
+def cruz_profile() -> BrowserProfile:
+    """``browser_profile()`` with images enabled: Cruz del Sur's captcha is one."""
+
+    profile = browser_profile()
+    return replace(profile, block=tuple(c for c in profile.block if c != "images"))
+
+
 class Chrome:
     """Context manager for a headless Chrome driver."""
 
-    def __init__(self) -> None:
+    def __init__(self, profile: Optional[BrowserProfile] = None) -> None:
+        profile = profile or browser_profile()
         opts = Options()
         opts.add_argument("--headless=new")
-        opts.add_argument("--window-size=1920,1080")
+        opts.add_argument(f"--window-size={profile.width},{profile.height}")
+        opts.page_load_strategy = profile.page_load_strategy
+        if profile.disable_gpu:
+            opts.add_argument("--disable-gpu")
+        if profile.disable_extensions:
+            opts.add_argument("--disable-extensions")
         self.driver = webdriver.Chrome(options=opts)
+        if profile.blocked_urls:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": profile.blocked_urls})
 
     def __enter__(self) -> webdriver.Chrome:
         return self.driver
@@ -231,14 +884,162 @@ class Chrome:
         self.driver.quit()
 
 
-def status_starken(tracking_number: str) -> str:
+def _browser(session: Optional[webdriver.Chrome] = None, profile: Optional[BrowserProfile] = None):
+    """Reuse ``session`` when given, otherwise open a fresh ``Chrome``."""
+
+    return nullcontext(session) if session is not None else Chrome(profile)
+
+
+# Starken endpoints; overridable so the HTTP path can run against a local
+# stand-in server.  ``STARKEN_API_URL`` is a template with ``{codigo}``.
+STARKEN_BASE_URL = os.environ.get("STARKEN_BASE_URL", "https://www.starken.cl")
+STARKEN_API_URL = os.environ.get("STARKEN_API_URL", "")
+
+# Keys compared lower-cased and without underscores.
+_STATUS_KEYS = ("estado", "status", "estadoenvio", "descripcionestado", "nombreestado")
+_DELIVERY_KEYS = ("fechaentrega", "fechadeentrega", "deliverydate", "fechaentregareal")
+
+
+# States a request wrapper can report about itself ("error", "not found").
+_WRAPPER_STATES = {"desconocido", "error", "sin_informacion"}
+
+
+def _find_status_record(payload: object, tracking_number: str = "") -> Optional[Tuple[str, str]]:
+    """Return ``(status, delivery date)`` from a JSON tracking payload.
+
+    The payload is walked breadth first, so the shipment record wins over
+    the entries of its event history.  Generic keys such as ``status`` also
+    hold API or build flags (``"success"``, ``"production"``, ``"error"``),
+    so a value is only taken when its object also holds ``tracking_number``
+    or it maps to a known shipment state other than ``_WRAPPER_STATES``.
+    """
+
+    queue = [payload]
+    while queue:
+        obj = queue.pop(0)
+        if isinstance(obj, dict):
+            keys = {str(k).lower().replace("_", ""): k for k in obj}
+            has_tracking = bool(tracking_number) and any(
+                _cell_text(v) == tracking_number for v in obj.values() if isinstance(v, (str, int, float))
+            )
+            for key in _STATUS_KEYS:
+                value = obj.get(keys.get(key))
+                if not isinstance(value, str) or not value.strip():
+                    continue
+                if has_tracking or normalize_state(value) not in _WRAPPER_STATES:
+                    fecha = next(
+                        (_cell_text(obj[keys[k]]) for k in _DELIVERY_KEYS if obj.get(keys.get(k))),
+                        "",
+                    )
+                    return value.strip(), fecha
+            queue.extend(obj.values())
+        elif isinstance(obj, list):
+            queue.extend(obj)
+    return None
+
+
+_WINDOW_STATE = re.compile(r"window\.__\w+__\s*=\s*(?=\{)")
+
+
+def _page_payloads(html: str) -> Iterator[object]:
+    """Yield the JSON documents embedded in a page (Next.js data, JSON scripts)."""
+
+    soup = BeautifulSoup(html, "html.parser")
+    decoder = json.JSONDecoder()
+    for script in soup.find_all("script"):
+        text = script.string or ""
+        if script.get("type") == "application/json" or script.get("id") == "__NEXT_DATA__":
+            try:
+                yield json.loads(text)
+            except ValueError:
+                pass
+            continue
+        # ``window.__STATE__ = {...};`` may be followed by more statements,
+        # so the object is decoded from where it starts up to where it ends.
+        for match in _WINDOW_STATE.finditer(text):
+            try:
+                yield decoder.raw_decode(text, match.end())[0]
+            except ValueError:
+                continue
+
+
+def status_starken_http(
+    tracking_number: str,
+    *,
+    base_url: Optional[str] = None,
+    api_url: Optional[str] = None,
+    timeout: int = 15,
+) -> Optional[str]:
+    """Starken status without a browser, or ``None`` if it cannot be read.
+
+    Reads the tracking data embedded in the page payload and, when
+    configured, the JSON data endpoint behind it.
+    """
+
+    base_url = (base_url or STARKEN_BASE_URL).rstrip("/")
+    api_url = STARKEN_API_URL if api_url is None else api_url
+    record = None
+    try:
+        with _span("starken_http", tracking=tracking_number):
+            r = HTTP.get(f"{base_url}/seguimiento", params={"codigo": tracking_number}, timeout=timeout)
+            r.raise_for_status()
+            for payload in _page_payloads(r.text):
+                record = _find_status_record(payload, tracking_number)
+                if record:
+                    break
+            if record is None and api_url:
+                r = HTTP.get(api_url.format(codigo=tracking_number), timeout=timeout)
+                r.raise_for_status()
+                record = _find_status_record(r.json(), tracking_number)
+    except (requests.RequestException, ValueError):
+        return None
+    if record is None:
+        return None
+    estado, fecha = record
+    return f"{estado} - {fecha}" if fecha else estado
+
+
+# Status of a browser lookup cut short by the run's deadline.
+DEADLINE_STATUS = "Error: límite de tiempo alcanzado"
+
+
+def _time_left(deadline: Optional[float]) -> float:
+    """Seconds until ``deadline`` (a ``time.time()`` value); infinite if unset."""
+
+    return math.inf if deadline is None else deadline - time.time()
+
+
+def status_starken(
+    tracking_number: str,
+    session: Optional[webdriver.Chrome] = None,
+    *,
+    deadline: Optional[float] = None,
+) -> str:
+    """Starken status: HTTP fast path first, headless browser as fallback.
+
+    ``session`` is an already open driver to reuse instead of starting one.
+    ``deadline`` (a ``time.time()`` value) bounds the browser waits.
+    """
+
+    return status_starken_http(tracking_number) or _status_starken_browser(
+        tracking_number, session, deadline=deadline
+    )
+
+
+def _status_starken_browser(
+    tracking_number: str,
+    session: Optional[webdriver.Chrome] = None,
+    *,
+    deadline: Optional[float] = None,
+) -> str:
     url = f"https://www.starken.cl/seguimiento?codigo={tracking_number}"
     try:
-        with Chrome() as driver:
-            driver.get(url)
-            time.sleep(3)
+        with _browser(session) as driver:
+            with _span("driver.get", url=url):
+                driver.get(url)
+            _sleep(3)
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
+            _sleep(2)
 
             posibles = [
                 "El envío ya fue entregado",
@@ -251,10 +1052,12 @@ def status_starken(tracking_number: str) -> str:
             ]
             estado_text = None
             fecha_text = None
-            wait = WebDriverWait(driver, 20)
             for palabra in posibles:
+                left = _time_left(deadline)
+                if left <= 0:
+                    return DEADLINE_STATUS
                 try:
-                    elem = wait.until(
+                    elem = WebDriverWait(driver, min(20, left)).until(
                         EC.presence_of_element_located(
                             (By.XPATH, f"//*[contains(text(),'{palabra}')]")
                         )
@@ -295,57 +1098,118 @@ def _parse_date_lines(text: str) -> List[tuple[datetime, str, str]]:
     return results
 
 
-def consulta_cruz_del_sur(tracking_number: str, *, max_tries: int = 5) -> Optional[str]:
-    """Query Cruz del Sur tracking. Requires a captcha bypass."""
+# Captcha position in the original 1920x1080 layout, used as a fallback.
+CAPTCHA_BOX = (563, 409, 701, 471)
+
+
+def _captcha_box(driver) -> Tuple[int, int, int, int]:
+    """Screenshot crop box of the captcha image, from its on-screen position."""
+
+    try:
+        img = driver.find_element(
+            By.XPATH,
+            "//img[contains(translate(@src,'CAPTCHA','captcha'),'captcha')"
+            " or contains(translate(@id,'CAPTCHA','captcha'),'captcha')]",
+        )
+        left, top, right, bottom, ratio = driver.execute_script(
+            "arguments[0].scrollIntoView({block: 'center'});"
+            "const r = arguments[0].getBoundingClientRect();"
+            "return [r.left, r.top, r.right, r.bottom, window.devicePixelRatio || 1];",
+            img,
+        )
+    except Exception:
+        print("Imagen de captcha no encontrada; se usa la posición fija")
+        return CAPTCHA_BOX
+    return (
+        int(left * ratio),
+        int(top * ratio),
+        int(math.ceil(right * ratio)),
+        int(math.ceil(bottom * ratio)),
+    )
+
+
+def _solve_captcha(image_path: str, api_key: str, deadline: Optional[float] = None) -> Optional[str]:
+    """Send a captcha image to 2Captcha and poll until it is solved.
+
+    Polling stops early at ``deadline`` (a ``time.time()`` value).
+    """
+
+    with _span("2captcha"):
+        with open(image_path, "rb") as f:
+            r = requests.post(
+                "http://2captcha.com/in.php",
+                files={"file": f},
+                data={"key": api_key, "method": "post"},
+                timeout=20,
+            )
+        if "OK|" not in r.text:
+            print("Error enviando captcha:", r.text)
+            return None
+        captcha_id = r.text.split("|")[1]
+        for _ in range(15):
+            if _time_left(deadline) < 5:
+                print("Captcha sin resolver al llegar la hora límite")
+                break
+            _sleep(5)
+            res = requests.get(
+                f"http://2captcha.com/res.php?key={api_key}&action=get&id={captcha_id}",
+                timeout=20,
+            )
+            if res.text == "CAPCHA_NOT_READY":
+                continue
+            if "OK|" in res.text:
+                return res.text.split("|")[1]
+            print("Error captcha:", res.text)
+            break
+    return None
+
+
+def consulta_cruz_del_sur(
+    tracking_number: str,
+    *,
+    max_tries: int = 5,
+    history: Optional[EventHistory] = None,
+    session: Optional[webdriver.Chrome] = None,
+    deadline: Optional[float] = None,
+) -> Optional[str]:
+    """Query Cruz del Sur tracking. Requires a captcha bypass.
+
+    When ``history`` is given every dated event of the timeline is stored,
+    not only the most recent one.  ``session`` is an open driver to reuse.
+    No new attempt or captcha poll starts after ``deadline`` (a
+    ``time.time()`` value).
+    """
 
     # API key is read from an environment variable so secrets are not hardcoded
     api_key = os.environ.get("API_KEY_2CAPTCHA")
     if not api_key:
         print("API key de 2Captcha no configurada (API_KEY_2CAPTCHA).")
         return None
+    profile = cruz_profile()
 
     for attempt in range(1, max_tries + 1):
+        if _time_left(deadline) <= 0:
+            print("Cruz del Sur: se alcanzó la hora límite, no se reintenta")
+            return None
         print(f"Consultando Cruz del Sur para {tracking_number} (intento {attempt})...")
         try:
-            with Chrome() as driver:
-                driver.get("https://www.cruzdelsurcarga.cl/seguimiento/")
-                time.sleep(2)
+            with _browser(session, profile) as driver:
+                with _span("driver.get", url="cruzdelsurcarga.cl/seguimiento"):
+                    driver.get("https://www.cruzdelsurcarga.cl/seguimiento/")
+                _sleep(2)
                 input_nro = WebDriverWait(driver, 10).until(
                     EC.presence_of_element_located((By.ID, "nrodoc"))
                 )
                 input_nro.clear()
                 input_nro.send_keys(tracking_number)
+                box = _captcha_box(driver)
                 driver.save_screenshot("screenshot.png")
                 from PIL import Image  # lazy import
 
                 im = Image.open("screenshot.png")
-                captcha_im = im.crop((563, 409, 701, 471))
+                captcha_im = im.crop(box)
                 captcha_im.save("captcha_crop.png")
-                with open("captcha_crop.png", "rb") as f:
-                    r = requests.post(
-                        "http://2captcha.com/in.php",
-                        files={"file": f},
-                        data={"key": api_key, "method": "post"},
-                        timeout=20,
-                    )
-                if "OK|" not in r.text:
-                    print("Error enviando captcha:", r.text)
-                    continue
-                captcha_id = r.text.split("|")[1]
-                captcha_result = None
-                for _ in range(15):
-                    time.sleep(5)
-                    res = requests.get(
-                        f"http://2captcha.com/res.php?key={api_key}&action=get&id={captcha_id}",
-                        timeout=20,
-                    )
-                    if res.text == "CAPCHA_NOT_READY":
-                        continue
-                    if "OK|" in res.text:
-                        captcha_result = res.text.split("|")[1]
-                        break
-                    print("Error captcha:", res.text)
-                    break
+                captcha_result = _solve_captcha("captcha_crop.png", api_key, deadline)
                 if not captcha_result:
                     continue
                 input_captcha = driver.find_element(By.ID, "captcha")
@@ -358,18 +1222,23 @@ def consulta_cruz_del_sur(tracking_number: str, *, max_tries: int = 5) -> Option
                 else:
                     print("Botón CONSULTAR no encontrado")
                     continue
-                time.sleep(6)
+                _sleep(6)
                 tables = driver.find_elements(By.TAG_NAME, "table")
                 all_dates = []
                 for table in tables:
                     all_dates.extend(_parse_date_lines(table.text))
                 if all_dates:
+                    if history is not None:
+                        history.add(tracking_number, [
+                            TrackingEvent(dt, "Cruz del Sur", line, normalize_state(status))
+                            for dt, line, status in all_dates
+                        ])
                     all_dates.sort(key=lambda x: x[0], reverse=True)
                     dt, _line, status = all_dates[0]
                     return f"{status} [{dt:%d/%m/%Y %H:%M}]"
         except Exception as exc:
             print("Fallo en la consulta:", exc)
-        time.sleep(3)
+        _sleep(max(0, min(3, _time_left(deadline))))
     print("Falló la consulta Cruz del Sur después de varios intentos.")
     return None
 
@@ -379,27 +1248,311 @@ def consulta_cruz_del_sur(tracking_number: str, *, max_tries: int = 5) -> Option
 # ---------------------------------------------------------------------------
 
 
-def update_status(shipment: Shipment, cruz_update: Optional[tuple[str, str]] = None) -> Shipment:
-    """Update shipment status in place and return it."""
+def update_status(
+    shipment: Shipment,
+    cruz_update: Optional[tuple[str, str]] = None,
+    history: Optional[EventHistory] = None,
+    deadline: Optional[float] = None,
+) -> Shipment:
+    """Update shipment status in place and return it.
+
+    When ``history`` is given the resulting status is recorded as an event
+    if it differs from the last one stored for the shipment.  ``deadline``
+    bounds the browser fallback of slow carriers.
+    """
 
     carrier = shipment.carrier.lower()
     tracking = shipment.tracking_number
-    if carrier == "fedex":
-        shipment.status = status_fedex(tracking)
-    elif carrier == "correos de chile":
-        shipment.status = status_correos_chile(tracking)
-    elif carrier == "starken":
-        shipment.status = status_starken(tracking)
-    elif carrier == "cruz del sur":
-        if cruz_update and tracking == cruz_update[0]:
-            shipment.status = cruz_update[1]
+    with _span("lookup", carrier=shipment.carrier, tracking=tracking):
+        if carrier == "fedex":
+            shipment.status = status_fedex(tracking)
+        elif carrier == "correos de chile":
+            shipment.status = status_correos_chile(tracking)
+        elif carrier == "starken":
+            shipment.status = status_starken(tracking, deadline=deadline)
+        elif carrier == "cruz del sur":
+            if cruz_update and tracking == cruz_update[0]:
+                shipment.status = cruz_update[1]
+            else:
+                shipment.status = shipment.status or "Requiere consulta manual"
         else:
-            shipment.status = shipment.status or "Requiere consulta manual"
-    else:
-        shipment.status = shipment.status or "Sin definir"
+            shipment.status = shipment.status or "Sin definir"
+    if history is not None and carrier != "cruz del sur":
+        history.observe(shipment)
     return shipment
 
 
+# Normalized states that will not change any more.
+TERMINAL_STATES = {"entregado"}
+# Starting estimate of one lookup per carrier, in seconds; refined as the
+# run measures real lookups.
+DEFAULT_LOOKUP_COSTS = {
+    "fedex": 2.0,
+    "correos de chile": 3.0,
+    "starken": 25.0,
+    "cruz del sur": 120.0,
+}
+# Time kept at the end of a budgeted run to write the workbook.
+BUDGET_RESERVE = 30.0
+
+
+class CheckLog:
+    """Last time each tracking number was successfully looked up.
+
+    Kept in a small JSON file next to the results workbook, so it exists
+    with or without ``--history`` (which only stores status changes).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._checked: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._checked = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def last(self, tracking: str) -> Optional[datetime]:
+        ts = self._checked.get(tracking)
+        return datetime.fromisoformat(ts) if ts else None
+
+    def mark(self, shipment: Shipment, when: Optional[datetime] = None) -> None:
+        """Record a lookup of ``shipment``; error results do not count."""
+
+        if normalize_state(shipment.status) == "error":
+            return
+        ts = (when or datetime.now()).isoformat(timespec="seconds")
+        with self._lock:
+            self._checked[shipment.tracking_number] = ts
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self._checked, sort_keys=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+def lookup_priority(
+    shipment: Shipment,
+    is_new: bool,
+    checks: Optional[CheckLog] = None,
+) -> Tuple[int, datetime]:
+    """Sort key of a lookup: new rows, then open ones, then delivered ones.
+
+    Within each group the shipment checked longest ago goes first, and
+    shipments never checked before go ahead of all of them.
+    """
+
+    if is_new:
+        group = 0
+    elif normalize_state(shipment.status) not in TERMINAL_STATES:
+        group = 1
+    else:
+        group = 2
+    last = checks.last(shipment.tracking_number) if checks is not None else None
+    return group, last or datetime.min
+
+
+class RunBudget:
+    """Wall-clock budget of a run and per-carrier lookup cost estimates.
+
+    Estimates start from ``DEFAULT_LOOKUP_COSTS`` and follow the measured
+    durations as an exponentially weighted moving average.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        costs: Optional[Dict[str, float]] = None,
+        alpha: float = 0.3,
+        reserve: float = BUDGET_RESERVE,
+    ) -> None:
+        self.end = time.monotonic() + seconds - reserve
+        # Same instant on the wall clock, for lookups in other processes.
+        self.deadline = time.time() + seconds - reserve
+        self.costs = dict(DEFAULT_LOOKUP_COSTS, **(costs or {}))
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.end - time.monotonic()
+
+    def estimate(self, carrier: str) -> float:
+        return self.costs.get(carrier.lower(), 5.0)
+
+    def observe(self, carrier: str, seconds: float) -> None:
+        key = carrier.lower()
+        with self._lock:
+            self.costs[key] = self.alpha * seconds + (1 - self.alpha) * self.estimate(key)
+
+    def fits(self, carrier: str) -> bool:
+        """Whether a lookup started now is expected to finish in time."""
+
+        return self.estimate(carrier) <= self.remaining()
+
+
+def _budget_seconds(deadline: Optional[str], max_runtime: Optional[float]) -> Optional[float]:
+    """Seconds allowed by ``--deadline HH:MM`` and/or ``--max-runtime``."""
+
+    limits = []
+    if max_runtime is not None:
+        limits.append(max_runtime)
+    if deadline:
+        try:
+            at = datetime.strptime(deadline, "%H:%M").time()
+        except ValueError:
+            raise SystemExit(f"--deadline debe tener formato HH:MM: {deadline}") from None
+        now = datetime.now()
+        end = datetime.combine(now.date(), at)
+        if end <= now:
+            raise SystemExit(f"La hora límite {deadline} ya pasó")
+        limits.append((end - now).total_seconds())
+    return min(limits) if limits else None
+
+
+class Checkpoint:
+    """Append-only journal of completed lookups, for resumable runs.
+
+    Each finished ``update_status`` is written as one JSON line and flushed
+    to disk right away.  When resuming, the journal is replayed and those
+    shipments keep their recorded status instead of being looked up again;
+    error results are not replayed so they get retried.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self._done: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, "rb+") as f:
+                end = 0  # offset just past the last complete line
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # last line cut short by a crash
+                    end += len(line)
+                    try:
+                        carrier, tracking, status, _ts = json.loads(line)
+                    except ValueError:
+                        continue
+                    if normalize_state(status) != "error":
+                        self._done[(carrier, tracking)] = status
+                # Drop the partial line so the next record starts on its own.
+                f.truncate(end)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def status(self, shipment: Shipment) -> Optional[str]:
+        """Recorded status of ``shipment``, or ``None`` if it is still pending."""
+
+        return self._done.get((shipment.carrier, shipment.tracking_number))
+
+    def record(self, shipment: Shipment) -> None:
+        line = json.dumps(
+            [shipment.carrier, shipment.tracking_number, shipment.status,
+             datetime.now().isoformat(timespec="seconds")],
+            ensure_ascii=False,
+        )
+        with self._lock:
+            self._done[(shipment.carrier, shipment.tracking_number)] = shipment.status
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, completed: bool = False) -> None:
+        """Close the journal; a completed run no longer needs it."""
+
+        self._file.close()
+        if completed:
+            os.remove(self.path)
+
+
+# Columns of the change feed, one row per new shipment or status change.
+CHANGE_COLUMNS = [
+    "change", "timestamp", "carrier", "tracking_number", "consignee", "company",
+    "reference", "old_status", "new_status", "old_state", "new_state",
+]
+CHANGE_FORMATS = (".jsonl", ".xlsx")
+
+
+def collect_changes(
+    before: List[str],
+    shipments: List[Shipment],
+    when: Optional[datetime] = None,
+) -> List[Dict[str, str]]:
+    """Rows of the change feed of one run.
+
+    ``before`` holds the statuses read from the results workbook; they
+    belong to the first ``len(before)`` entries of ``shipments`` and every
+    later entry is a shipment added by this run.
+    """
+
+    stamp = (when or datetime.now()).isoformat(timespec="seconds")
+    changes = []
+    for i, s in enumerate(shipments):
+        old = before[i] if i < len(before) else None
+        if old == s.status:
+            continue
+        changes.append({
+            "change": "new" if old is None else "status",
+            "timestamp": stamp,
+            "carrier": s.carrier,
+            "tracking_number": s.tracking_number,
+            "consignee": s.consignee,
+            "company": s.company,
+            "reference": s.reference,
+            "old_status": old or "",
+            "new_status": s.status,
+            "old_state": normalize_state(old) if old else "",
+            "new_state": normalize_state(s.status),
+        })
+    return changes
+
+
+def write_changes(path: str, changes: List[Dict[str, str]], table_name: str = "Cambios") -> None:
+    """Write the change feed as JSON lines or as an Excel table.
+
+    The Excel flavour holds a single table named ``table_name`` so flows
+    can read it with the "list rows present in a table" action.  An Excel
+    table cannot be empty, so without changes no workbook is written and
+    the one of the previous run is removed; the JSON lines file is left
+    empty instead.
+    """
+
+    if path.lower().endswith(".jsonl"):
+        with open(path, "w", encoding="utf-8") as f:
+            for change in changes:
+                f.write(json.dumps(change, ensure_ascii=False) + "\n")
+        return
+    from openpyxl import Workbook  # lazy import
+    from openpyxl.utils import get_column_letter  # lazy import
+    from openpyxl.worksheet.table import Table
+
+    if not changes:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    wb = Workbook()
+    ws = wb.active
+    ws.title = table_name
+    ws.append(CHANGE_COLUMNS)
+    for change in changes:
+        ws.append([change[c] for c in CHANGE_COLUMNS])
+    last_row = len(changes) + 1
+    ws.add_table(Table(displayName=table_name, ref=f"A1:{get_column_letter(len(CHANGE_COLUMNS))}{last_row}"))
+    wb.save(path)
+
+
+def _row_to_shipment(row: Iterable[object]) -> Shipment:
+    """Build a ``Shipment`` from a row of the results workbook."""
+
+    return Shipment(*(_cell_text(v) for v in list(row)[: len(RESULT_COLUMNS)]))
+
+
 # ---------------------------------------------------------------------------
 # Example CLI
 # ---------------------------------------------------------------------------
@@ -417,73 +1570,317 @@ def main() -> None:  # pragma: no cover - CLI helper
         default="envios.xlsx",
         help="Excel file where results are stored (default: envios.xlsx)",
     )
+    parser.add_argument(
+        "--history",
+        help="JSON lines file where every tracking event is stored",
+    )
+    parser.add_argument(
+        "--changes",
+        metavar="PATH",
+        help="Write the new shipments and status changes of this run (.jsonl or .xlsx)",
+    )
+    parser.add_argument(
+        "--learn-layout",
+        action="store_true",
+        help="Learn each carrier's PDF table layout once and reuse it on every page",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Status lookups run in parallel while manifests are parsed (default: 4)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="OUT_JSON",
+        help="Write a Chrome/Perfetto trace of every stage to this file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Run under cProfile and write run.prof plus per-stage reports here",
+    )
+    parser.add_argument(
+        "--deadline",
+        metavar="HH:MM",
+        help="Finish before this time today, postponing lookups that would not make it",
+    )
+    parser.add_argument(
+        "--max-runtime",
+        type=float,
+        metavar="SECONDS",
+        help="Like --deadline, as a maximum duration of the run",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Replay the checkpoint journal of an interrupted run and only look up the rest",
+    )
+    parser.add_argument(
+        "--browser-memory-mb",
+        type=int,
+        help="Run Starken browser lookups in a process farm sized to this RSS budget",
+    )
+    parser.add_argument(
+        "--browser-worker-mb",
+        type=int,
+        default=700,
+        help="RSS limit per browser worker; larger workers are restarted (default: 700)",
+    )
     args = parser.parse_args()
 
+    global _TRACER
+    if args.trace:
+        _TRACER = Tracer()
+    profiler = RunProfiler() if args.profile else None
+    if profiler is not None:
+        profiler.start()
+    try:
+        _run(args, profiler)
+    finally:
+        if profiler is not None:
+            profiler.write(args.profile)
+            print(f"Perfiles escritos en {args.profile}")
+        if _TRACER is not None:
+            _TRACER.write(args.trace)
+            print(f"Traza escrita en {args.trace}")
+
+
+def _run(args, profiler: Optional[RunProfiler] = None) -> None:  # pragma: no cover - CLI helper
+    """Body of the CLI: parse manifests, look up statuses and save."""
+
+    history = EventHistory(os.path.abspath(args.history)) if args.history else None
+    seconds = _budget_seconds(args.deadline, args.max_runtime)
+    budget = RunBudget(seconds) if seconds is not None else None
+    deadline = budget.deadline if budget is not None else None
+    if args.changes and not args.changes.lower().endswith(CHANGE_FORMATS):
+        raise SystemExit(f"--changes debe terminar en {' o '.join(CHANGE_FORMATS)}: {args.changes}")
+
     excel_path = os.path.abspath(args.excel)
     if not os.path.exists(excel_path):
-        pd.DataFrame(columns=[
-            "Tipo",
-            "Numero de Seguimiento/Orden",
-            "Consignatario/Destinatario",
-            "Compañía de Envío",
-            "Referencia",
-            "Estado",
-        ]).to_excel(excel_path, index=False)
+        pd.DataFrame(columns=RESULT_COLUMNS).to_excel(excel_path, index=False)
         print(f"Creado archivo: {excel_path}")
 
-    df = pd.read_excel(excel_path)
-    existing = set(df["Numero de Seguimiento/Orden"].astype(str))
-    new_shipments: List[Shipment] = []
+    journal_path = excel_path + ".journal.jsonl"
+    if not args.resume and os.path.exists(journal_path):
+        print("Se descarta el registro de una ejecución interrumpida (usar --resume para continuarla)")
+    journal = Checkpoint(journal_path, resume=args.resume)
+    checks = CheckLog(excel_path + ".checked.json")
+    if args.resume:
+        print(f"Reanudando: {len(journal)} consultas ya completadas")
+
+    with _span("read_excel", path=excel_path):
+        df = pd.read_excel(excel_path)
+    shipments = [_row_to_shipment(row) for row in df.itertuples(index=False, name=None)]
+    existing = {s.tracking_number for s in shipments}
+    before = [s.status for s in shipments]
     cruz_del_sur_track = None
-
-    for file in os.listdir(args.directory):
-        path = os.path.join(args.directory, file)
-        lower = file.lower()
-        if lower.endswith(".pdf"):
-            if "fedex" in lower:
-                items = extract_fedex_pdf(path)
-                print(f"FedEx: {len(items)} envíos de {file}")
-                new_shipments.extend(items)
-            elif "manifiesto" in lower or "correos" in lower:
-                items = extract_correos_chile_pdf(path)
-                print(f"CorreosChile: {len(items)} envíos de {file}")
-                new_shipments.extend(items)
-        elif lower.endswith((".xlsx", ".xls")):
-            if "cruz" in lower:
-                items = extract_cruz_del_sur_excel(path)
-                print(f"Cruz del Sur: {len(items)} envíos de {file}")
-                new_shipments.extend(items)
-                for it in items:
-                    if it.tracking_number:
-                        cruz_del_sur_track = it.tracking_number
-                        break
-            elif "starken" in lower:
-                items = extract_starken_excel(path)
-                print(f"Starken: {len(items)} envíos de {file}")
-                new_shipments.extend(items)
-
-    new_filtered = [s for s in new_shipments if s.tracking_number not in existing]
-    if new_filtered:
-        df2 = pd.DataFrame([
-            [s.carrier, s.tracking_number, s.consignee, s.company, s.reference, s.status]
-            for s in new_filtered
-        ], columns=df.columns)
-        df = pd.concat([df, df2], ignore_index=True)
-        print("Actualizando estados...")
-
-    cruz_update = None
-    if cruz_del_sur_track:
-        estado = consulta_cruz_del_sur(cruz_del_sur_track)
+    futures: List[Future] = []
+    # Cruz del Sur rows depend on the single captcha query below, which is
+    # only known once every manifest has been scanned.
+    cruz_rows: List[Shipment] = []
+    # With a budget, lookups wait here until every row is known and are
+    # then started by priority; the ones that do not fit are deferred.
+    queued: List[Shipment] = []
+    deferred: List[Shipment] = []
+    cruz_result: Dict[str, str] = {}
+
+    # Starken lookups go to the browser farm when it is enabled; several
+    # rows may share a tracking number but it is looked up only once.
+    farm_rows: Dict[Tuple[str, str], List[Shipment]] = {}
+    farm_lock = threading.Lock()
+    farm_started: Dict[Tuple[str, str], float] = {}
+
+    def farm_done(carrier: str, tracking: str, status: str) -> None:
+        with farm_lock:
+            rows = farm_rows.pop((carrier, tracking), [])
+            started = farm_started.pop((carrier, tracking), None)
+        if budget is not None and started is not None:
+            budget.observe(carrier, time.monotonic() - started)
+        if status == DEADLINE_STATUS:
+            deferred.extend(rows)  # keep their previous status
+            return
+        for row in rows:
+            row.status = status
+            if history is not None:
+                history.observe(row)
+            journal.record(row)
+            checks.mark(row)
+
+    def lookup(shipment: Shipment, cruz_update: Optional[tuple[str, str]] = None) -> None:
+        started = time.monotonic()
+        previous = shipment.status
+        update_status(shipment, cruz_update, history, deadline)
+        # Cruz del Sur rows only copy the captcha query timed in cruz_lookup.
+        if budget is not None and shipment.carrier.lower() != "cruz del sur":
+            budget.observe(shipment.carrier, time.monotonic() - started)
+        if shipment.status == DEADLINE_STATUS:
+            shipment.status = previous
+            deferred.append(shipment)
+            return
+        journal.record(shipment)
+        if cruz_update is not None or shipment.carrier.lower() != "cruz del sur":
+            checks.mark(shipment)
+
+    def cruz_lookup(shipment: Shipment) -> None:
+        started = time.monotonic()
+        estado = consulta_cruz_del_sur(shipment.tracking_number, history=history, deadline=deadline)
+        budget.observe(shipment.carrier, time.monotonic() - started)
+        if not estado and budget.remaining() <= 0:
+            deferred.append(shipment)
+            return
         if estado:
-            cruz_update = (cruz_del_sur_track, estado)
+            cruz_result[shipment.tracking_number] = estado
+        lookup(shipment, (shipment.tracking_number, estado) if estado else None)
+
+    try:
+        with ExitStack() as stack:
+            pool = stack.enter_context(ThreadPoolExecutor(
+                max_workers=args.workers,
+                thread_name_prefix="lookup",
+                initializer=profiler.thread_initializer if profiler is not None else None,
+            ))
+            farm = None
+            if args.browser_memory_mb:
+                from browser_farm import BrowserFarm, FarmConfig, browser_lookup  # lazy import
+
+                config = FarmConfig(args.browser_memory_mb, args.browser_worker_mb)
+                print(f"Granja de navegadores: {config.workers()} procesos")
+                farm = stack.enter_context(BrowserFarm(
+                    config, farm_done, lookup=functools.partial(browser_lookup, deadline=deadline),
+                    tracer=_TRACER,
+                ))
+
+            def submit(shipment: Shipment) -> None:
+                carrier = shipment.carrier.lower()
+                done = journal.status(shipment)
+                if done is not None:
+                    shipment.status = done
+                    checks.mark(shipment)  # looked up by the interrupted run
+                elif budget is not None:
+                    queued.append(shipment)
+                elif carrier == "cruz del sur":
+                    cruz_rows.append(shipment)
+                elif farm is not None and carrier == "starken":
+                    submit_farm(shipment)
+                else:
+                    futures.append(pool.submit(lookup, shipment))
+
+            def submit_farm(shipment: Shipment) -> None:
+                key = (shipment.carrier, shipment.tracking_number)
+                with farm_lock:
+                    if key not in farm_rows:
+                        farm_rows[key] = []
+                        farm_started[key] = time.monotonic()
+                        farm.submit(*key)
+                    farm_rows[key].append(shipment)
+
+            def dispatch_by_priority() -> None:
+                """Start the queued lookups in priority order while they fit."""
+
+                order = sorted(
+                    queued,
+                    key=lambda s: lookup_priority(s, s.tracking_number not in existing, checks),
+                )
+                running: Set[Future] = set()
+                for shipment in order:
+                    carrier = shipment.carrier.lower()
+                    if carrier == "cruz del sur" and shipment.tracking_number != cruz_del_sur_track:
+                        cruz_rows.append(shipment)  # no lookup needed
+                        continue
+                    in_farm = farm is not None and carrier == "starken"
+                    # Wait for a free slot so the estimate starts from now.
+                    if in_farm:
+                        while len(farm_rows) >= config.workers() and budget.remaining() > 0:
+                            time.sleep(0.2)
+                    else:
+                        while len(running) >= args.workers:
+                            _, running = wait_futures(running, return_when=FIRST_COMPLETED)
+                    if not budget.fits(shipment.carrier):
+                        deferred.append(shipment)
+                    elif in_farm:
+                        submit_farm(shipment)
+                    else:
+                        task = cruz_lookup if carrier == "cruz del sur" else lookup
+                        future = pool.submit(task, shipment)
+                        running.add(future)
+                        futures.append(future)
+
+            try:
+                # Known rows start their lookups while the manifests are parsed.
+                for shipment in shipments:
+                    submit(shipment)
+
+                added = 0
+                for file in sorted(os.listdir(args.directory)):
+                    path = os.path.join(args.directory, file)
+                    count = 0
+                    carrier = ""
+                    for item in iter_shipments(path, learn_layout=args.learn_layout):
+                        count += 1
+                        carrier = item.carrier
+                        if carrier == "Cruz del Sur" and cruz_del_sur_track is None:
+                            cruz_del_sur_track = item.tracking_number
+                        if item.tracking_number in existing:
+                            continue
+                        shipments.append(item)
+                        submit(item)
+                        added += 1
+                    if count:
+                        print(f"{carrier}: {count} envíos de {file}")
+                if added:
+                    print("Actualizando estados...")
+
+                cruz_update = None
+                if budget is not None:
+                    dispatch_by_priority()
+                    for future in futures:
+                        future.result()
+                    if cruz_del_sur_track in cruz_result:
+                        cruz_update = (cruz_del_sur_track, cruz_result[cruz_del_sur_track])
+                # Skipped when a resumed journal already holds this row.
+                elif any(s.tracking_number == cruz_del_sur_track for s in cruz_rows):
+                    estado = consulta_cruz_del_sur(cruz_del_sur_track, history=history)
+                    if estado:
+                        cruz_update = (cruz_del_sur_track, estado)
+                for shipment in cruz_rows:
+                    futures.append(pool.submit(lookup, shipment, cruz_update))
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                # Let running lookups finish (and be journaled), drop the rest.
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+    except KeyboardInterrupt:
+        # Only now is the browser farm stopped, so no result can still arrive.
+        journal.close()
+        checks.save()
+        print(f"Interrumpido: {len(journal)} consultas guardadas; continuar con --resume")
+        raise
 
-    updated_rows = [update_status(Shipment(**row._asdict()), cruz_update) for row in df.itertuples(index=False)]
     df_updated = pd.DataFrame([
         [s.carrier, s.tracking_number, s.consignee, s.company, s.reference, s.status]
-        for s in updated_rows
-    ], columns=df.columns)
-    df_updated.to_excel(excel_path, index=False)
+        for s in shipments
+    ], columns=RESULT_COLUMNS)
+    with _span("to_excel", path=excel_path):
+        df_updated.to_excel(excel_path, index=False)
+    journal.close(completed=True)
+    checks.save()
     print("Excel actualizado")
+    if deferred:
+        print(f"Pospuestos por falta de tiempo: {len(deferred)} envíos")
+        by_carrier: Dict[str, List[str]] = {}
+        for s in deferred:
+            by_carrier.setdefault(s.carrier, []).append(s.tracking_number)
+        for carrier, numbers in by_carrier.items():
+            print(f"  {carrier} ({len(numbers)}): {', '.join(numbers)}")
+    if args.changes:
+        changes = collect_changes(before, shipments)
+        write_changes(args.changes, changes)
+        if changes or args.changes.lower().endswith(".jsonl"):
+            print(f"{len(changes)} cambios escritos en {args.changes}")
+        else:
+            print(f"Sin cambios: no se genera {args.changes}")
 
 
 if __name__ == "__main__":  # pragma: no cover - CLI
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Local JSON API over the results workbook written by ``shipping_tracker``.
+
+The workbook is read once into an in-memory index (tracking number,
+consignee and normalized state) and re-read in the background whenever the
+file changes on disk, so status questions no longer need Excel:
+
+* ``GET /shipments/<tracking>``: rows of one tracking number,
+* ``GET /shipments?consignee=...&status=...&carrier=...``: filtered rows,
+  ``status`` being a normalized state such as ``entregado``,
+* ``POST /shipments/bulk`` with ``{"tracking_numbers": [...]}``,
+* ``GET /health``: number of rows and time of the last load.
+
+Example::
+
+    python status_service.py envios.xlsx --port 8765
+    curl http://127.0.0.1:8765/shipments/1234567890
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from shipping_tracker import Shipment, _iter_excel_values, _row_to_shipment, normalize_state
+
+DEFAULT_PORT = 8765
+DEFAULT_POLL_INTERVAL = 5.0
+# Upper bound of a bulk request, to keep a single call cheap.
+MAX_BULK = 5000
+
+
+def _key(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def _as_dict(shipment: Shipment) -> dict:
+    data = asdict(shipment)
+    data["state"] = normalize_state(shipment.status)
+    return data
+
+
+class ShipmentIndex:
+    """Immutable lookup tables over the rows of one load of the workbook."""
+
+    def __init__(self, shipments: Iterable[Shipment]) -> None:
+        self.shipments: List[Shipment] = list(shipments)
+        self.by_tracking: Dict[str, List[Shipment]] = {}
+        self.by_consignee: Dict[str, List[Shipment]] = {}
+        self.by_state: Dict[str, List[Shipment]] = {}
+        for s in self.shipments:
+            self.by_tracking.setdefault(s.tracking_number, []).append(s)
+            self.by_consignee.setdefault(_key(s.consignee), []).append(s)
+            self.by_state.setdefault(normalize_state(s.status), []).append(s)
+        self.loaded_at = datetime.now()
+
+    @classmethod
+    def load(cls, path: str) -> "ShipmentIndex":
+        rows = _iter_excel_values(path)
+        next(rows, None)  # header
+        return cls(
+            _row_to_shipment(row) for row in rows
+            if any(v is not None for v in row)
+        )
+
+    def __len__(self) -> int:
+        return len(self.shipments)
+
+    def get(self, tracking: str) -> List[Shipment]:
+        return self.by_tracking.get(tracking.strip(), [])
+
+    def query(
+        self,
+        consignee: Optional[str] = None,
+        state: Optional[str] = None,
+        carrier: Optional[str] = None,
+    ) -> List[Shipment]:
+        """Rows matching every given filter (exact, case-insensitive)."""
+
+        candidates: List[List[Shipment]] = []
+        if consignee:
+            candidates.append(self.by_consignee.get(_key(consignee), []))
+        if state:
+            candidates.append(self.by_state.get(state.strip().lower(), []))
+        # Scan the smallest bucket and check the other filters on it.
+        rows = min(candidates, key=len) if candidates else self.shipments
+        return [
+            s for s in rows
+            if (not consignee or _key(s.consignee) == _key(consignee))
+            and (not state or normalize_state(s.status) == state.strip().lower())
+            and (not carrier or _key(s.carrier) == _key(carrier))
+        ]
+
+
+class StatusService:
+    """Keeps a ``ShipmentIndex`` of ``path`` up to date.
+
+    A watcher thread compares the file's modification time and size every
+    ``poll_interval`` seconds and swaps in a new index when they change.  A
+    load that fails (e.g. the tracker is still writing the file) keeps the
+    previous index and is retried on the next poll.
+    """
+
+    def __init__(self, path: str, poll_interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self.index = ShipmentIndex(())
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="status-watcher", daemon=True)
+        self.reload()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self) -> bool:
+        """Re-read the workbook if it changed; return whether it was reloaded."""
+
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        try:
+            index = ShipmentIndex.load(self.path)
+        except Exception as exc:  # file being rewritten, retry later
+            print(f"No se pudo leer {self.path}: {exc}")
+            return False
+        # Readers keep using the old index until this single assignment.
+        self.index = index
+        self._stamp = stamp
+        print(f"Índice cargado: {len(index)} envíos")
+        return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+# ---------------------------------------------------------------------------
+# HTTP layer
+# ---------------------------------------------------------------------------
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: StatusService  # set by make_server
+
+    def _send(self, code: int, payload: object) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        index = self.service.index
+        if url.path == "/health":
+            self._send(200, {
+                "ok": True,
+                "rows": len(index),
+                "loaded_at": index.loaded_at.isoformat(timespec="seconds"),
+            })
+        elif url.path.rstrip("/") == "/shipments":
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            rows = index.query(params.get("consignee"), params.get("status"), params.get("carrier"))
+            self._send(200, {"shipments": [_as_dict(s) for s in rows]})
+        elif url.path.startswith("/shipments/"):
+            tracking = unquote(url.path[len("/shipments/"):])
+            rows = index.get(tracking)
+            if rows:
+                self._send(200, {"shipments": [_as_dict(s) for s in rows]})
+            else:
+                self._send(404, {"error": f"No existe el envío {tracking}"})
+        else:
+            self._send(404, {"error": "Ruta desconocida"})
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/shipments/bulk":
+            self._send(404, {"error": "Ruta desconocida"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            numbers = json.loads(self.rfile.read(length) or b"{}")["tracking_numbers"]
+            if not isinstance(numbers, list):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {"error": 'Se espera {"tracking_numbers": [...]}'})
+            return
+        if len(numbers) > MAX_BULK:
+            self._send(413, {"error": f"Máximo {MAX_BULK} envíos por consulta"})
+            return
+        index = self.service.index
+        found: Dict[str, List[dict]] = {}
+        missing: List[str] = []
+        for tracking in map(str, numbers):
+            rows = index.get(tracking)
+            if rows:
+                found[tracking] = [_as_dict(s) for s in rows]
+            else:
+                missing.append(tracking)
+        self._send(200, {"shipments": found, "missing": missing})
+
+    def log_message(self, format: str, *args) -> None:  # quiet by default
+        pass
+
+
+def make_server(service: StatusService, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """HTTP server answering from ``service``; call ``serve_forever`` on it."""
+
+    handler = type("Handler", (_Handler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# ---------------------------------------------------------------------------
+# Example CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:  # pragma: no cover - CLI helper
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servicio local de consulta de estados")
+    parser.add_argument("excel", help="Excel de resultados de shipping_tracker")
+    parser.add_argument("--host", default="127.0.0.1", help="Usar 0.0.0.0 para aceptar conexiones de la red")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--poll", type=float, default=DEFAULT_POLL_INTERVAL,
+        help="Segundos entre revisiones de cambios del archivo",
+    )
+    args = parser.parse_args()
+
+    service = StatusService(os.path.abspath(args.excel), args.poll)
+    service.start()
+    server = make_server(service, args.host, args.port)
+    print(f"Escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI
+    main()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Offline reconciliation of purchases into the ``Stock`` table.
+
+This is the local counterpart of ``actualizarStock.ts``: it merges the rows
+of a purchases file (``Código``, ``Pedido``, ``Fecha llegada``) into the
+``Stock`` table of a workbook on disk.  Instead of searching the code column
+for every purchase and writing cell by cell, it:
+
+* builds a hash index ``código -> fila`` of the table once,
+* computes every update and new row in memory,
+* writes the result back in a single pass and saves the workbook once.
+
+Example::
+
+    python stock_reconcile.py "Stock y Pedidos.xlsx" compras.xlsx
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, range_boundaries
+
+# Column positions inside the Stock table, same as in ``actualizarStock.ts``.
+COL_CODIGO = 0
+COL_PRODUCTO = 1
+COL_STOCK = 2
+COL_PEDIDO = 3
+COL_FECHA_PEDIDO = 5
+COL_CANTIDAD = 6
+COL_LLEGADA = 7
+COL_TOTAL = 8
+CLEARED_COLUMNS = (COL_PEDIDO, COL_FECHA_PEDIDO, COL_CANTIDAD, COL_LLEGADA)
+TABLE_WIDTH = 9
+
+
+@dataclass
+class Purchase:
+    """A purchase row as selected by the Power Automate flow."""
+
+    codigo: str
+    cantidad: float
+    fecha_llegada: str
+    producto: str = ""
+
+
+def _norm(text: object) -> str:
+    """Upper-case ``text`` and strip accents so ``Código`` matches ``CODIGO``."""
+
+    decomposed = unicodedata.normalize("NFKD", str(text or "").strip().upper())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _code(value: object) -> str:
+    """Return the lookup key of a code cell (``1234.0`` and ``"1234"`` match)."""
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return "" if value is None else str(value).strip()
+
+
+def _cell(row: tuple, idx: Dict[str, int], name: str) -> object:
+    pos = idx.get(name)
+    return row[pos] if pos is not None and pos < len(row) else None
+
+
+def read_purchases(path: str, sheet: Optional[str] = None) -> List[Purchase]:
+    """Read purchases from the first table-like block of ``path``.
+
+    The header row is located by looking for ``Código`` and ``Pedido``; the
+    sheet is streamed in read-only mode so large files stay cheap.
+    """
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        purchases: List[Purchase] = []
+        idx: Optional[Dict[str, int]] = None
+        for row in ws.iter_rows(values_only=True):
+            if idx is None:
+                names = [_norm(v) for v in row]
+                if "CODIGO" in names and "PEDIDO" in names:
+                    idx = {n: i for i, n in enumerate(names) if n}
+                continue
+            codigo = _code(row[idx["CODIGO"]])
+            if not codigo:
+                continue
+            fecha = _cell(row, idx, "FECHA LLEGADA")
+            if isinstance(fecha, date):
+                fecha = fecha.isoformat()[:10]
+            purchases.append(
+                Purchase(
+                    codigo,
+                    float(_cell(row, idx, "PEDIDO") or 0),
+                    "" if fecha is None else str(fecha),
+                    str(_cell(row, idx, "PRODUCTO") or ""),
+                )
+            )
+        if idx is None:
+            raise ValueError(f"No se encontraron encabezados Código/Pedido en: {path}")
+        return purchases
+    finally:
+        wb.close()
+
+
+def _find_table(wb, name: str):
+    for ws in wb.worksheets:
+        if name in ws.tables:
+            return ws, ws.tables[name]
+    raise ValueError(f"No existe la tabla {name!r} en el libro")
+
+
+def compute_updates(
+    body: List[List[object]],
+    purchases: List[Purchase],
+    today: date,
+) -> Tuple[List[List[object]], Set[int]]:
+    """Return the new table body and the positions touched by ``purchases``.
+
+    ``body`` holds the current rows (without header).  Pending-order columns
+    are cleared first, then every purchase updates its row or appends a new
+    one with ``Stock = 0``; later purchases of the same code win, exactly as
+    in the Office Script.
+    """
+
+    rows = [list(r) + [None] * (TABLE_WIDTH - len(r)) for r in body]
+    for r in rows:
+        for col in CLEARED_COLUMNS:
+            r[col] = ""
+    touched: Set[int] = set()
+    index: Dict[str, int] = {}
+    for i, r in enumerate(rows):
+        index.setdefault(_code(r[COL_CODIGO]), i)
+
+    for p in purchases:
+        pos = index.get(p.codigo)
+        if pos is None:
+            pos = len(rows)
+            index[p.codigo] = pos
+            rows.append([p.codigo, p.producto, 0, "", "", "", "", "", ""])
+        r = rows[pos]
+        r[COL_PEDIDO] = "Sí"
+        r[COL_FECHA_PEDIDO] = today
+        r[COL_CANTIDAD] = p.cantidad
+        r[COL_LLEGADA] = p.fecha_llegada
+        touched.add(pos)
+    return rows, touched
+
+
+def reconcile(
+    stock_path: str,
+    purchases: List[Purchase],
+    *,
+    table_name: str = "Stock",
+    output: Optional[str] = None,
+    today: Optional[date] = None,
+) -> int:
+    """Merge ``purchases`` into ``table_name`` and save the workbook.
+
+    Returns the number of purchases processed, like the Office Script.
+    """
+
+    wb = load_workbook(stock_path)
+    ws, table = _find_table(wb, table_name)
+    if table.totalsRowCount:
+        raise ValueError(f"La tabla {table_name!r} tiene fila de totales; no soportado")
+    min_col, min_row, max_col, max_row = range_boundaries(table.ref)
+    last_col = max(max_col, min_col + TABLE_WIDTH - 1)
+    body = [
+        list(r)
+        for r in ws.iter_rows(
+            min_row=min_row + 1,
+            max_row=max_row,
+            min_col=min_col,
+            max_col=last_col,
+            values_only=True,
+        )
+    ]
+    rows, touched = compute_updates(body, purchases, today or date.today())
+
+    stock_letter = get_column_letter(min_col + COL_STOCK)
+    cantidad_letter = get_column_letter(min_col + COL_CANTIDAD)
+    n_existing = len(body)
+    for i, r in enumerate(rows):
+        excel_row = min_row + 1 + i
+        if i in touched:
+            r[COL_TOTAL] = f"={stock_letter}{excel_row}+{cantidad_letter}{excel_row}"
+        # Existing rows only change in the order columns; new rows are full.
+        cols = range(TABLE_WIDTH) if i >= n_existing else (*CLEARED_COLUMNS, COL_TOTAL)
+        for col in cols:
+            ws.cell(row=excel_row, column=min_col + col, value=r[col])
+
+    new_max_row = min_row + len(rows)
+    ref = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{new_max_row}"
+    table.ref = ref
+    if table.autoFilter is not None:
+        table.autoFilter.ref = ref
+    wb.save(output or stock_path)
+    return len(purchases)
+
+
+# ---------------------------------------------------------------------------
+# Example CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:  # pragma: no cover - CLI helper
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Actualiza la tabla Stock con compras")
+    parser.add_argument("stock", help="Libro con la tabla de stock")
+    parser.add_argument("compras", help="Archivo XLSX con las compras")
+    parser.add_argument("--table", default="Stock", help="Nombre de la tabla (default: Stock)")
+    parser.add_argument("--sheet", help="Hoja de compras (default: la primera)")
+    parser.add_argument("--output", help="Guardar en otro archivo en vez de sobrescribir")
+    args = parser.parse_args()
+
+    purchases = read_purchases(args.compras, args.sheet)
+    procesados = reconcile(args.stock, purchases, table_name=args.table, output=args.output)
+    print(f"✅ {procesados} compras procesadas en {args.output or args.stock}")
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI
+    main()
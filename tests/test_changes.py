@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Change feed written with ``--changes``."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shipping_tracker as st  # noqa: E402
+
+CHANGE = {c: "" for c in st.CHANGE_COLUMNS}
+
+
+def test_excel_table_covers_the_changes(tmp_path):
+    from openpyxl import load_workbook
+
+    path = str(tmp_path / "cambios.xlsx")
+    st.write_changes(path, [dict(CHANGE, tracking_number="1"), dict(CHANGE, tracking_number="2")])
+    ws = load_workbook(path).active
+    assert ws.tables["Cambios"].ref.endswith("3")
+    assert ws.max_row == 3
+
+
+def test_no_changes_leaves_no_blank_row(tmp_path):
+    xlsx = str(tmp_path / "cambios.xlsx")
+    jsonl = str(tmp_path / "cambios.jsonl")
+    st.write_changes(xlsx, [CHANGE])
+    st.write_changes(xlsx, [])
+    st.write_changes(jsonl, [])
+    assert not os.path.exists(xlsx)
+    assert os.path.getsize(jsonl) == 0
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Resumable run journal."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shipping_tracker as st  # noqa: E402
+
+
+def _shipment(tracking, status):
+    return st.Shipment("Starken", tracking, "", "", "", status)
+
+
+def test_resume_after_cut_short_line(tmp_path):
+    path = str(tmp_path / "envios.journal.jsonl")
+    journal = st.Checkpoint(path)
+    journal.record(_shipment("1", "ENTREGADO"))
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["Starken", "2", "En tr')  # crash mid-write
+
+    journal = st.Checkpoint(path, resume=True)
+    journal.record(_shipment("3", "En reparto"))
+    journal.close()
+
+    resumed = st.Checkpoint(path, resume=True)
+    assert resumed.status(_shipment("1", "")) == "ENTREGADO"
+    assert resumed.status(_shipment("2", "")) is None
+    assert resumed.status(_shipment("3", "")) == "En reparto"
+    resumed.close()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Learned PDF table layouts must not leak between manifests."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shipping_tracker as st  # noqa: E402
+
+pytest.importorskip("reportlab")
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.platypus import PageBreak, SimpleDocTemplate, Table, TableStyle  # noqa: E402
+
+HEADER = ["TRACKING", "REFERENCIA", "DESTINATARIO"]
+
+
+def _fedex_pdf(path, widths, pages=2, rows=15, first=10000000):
+    """FedEx-like manifest: one ruled 3-column table per page."""
+
+    story = []
+    n = first
+    for page in range(pages):
+        data = [HEADER]
+        for _ in range(rows):
+            data.append([str(n), f"REF-{n}", f"Cliente {n}"])
+            n += 1
+        table = Table(data, colWidths=widths)
+        table.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, "black")]))
+        story.append(table)
+        if page < pages - 1:
+            story.append(PageBreak())
+    SimpleDocTemplate(str(path), pagesize=A4).build(story)
+
+
+@pytest.fixture
+def manifests(tmp_path):
+    narrow = tmp_path / "fedex_a.pdf"
+    wide = tmp_path / "fedex_b.pdf"
+    _fedex_pdf(narrow, [90, 90, 120])
+    _fedex_pdf(wide, [150, 60, 200], first=20000000)
+    return str(narrow), str(wide)
+
+
+def test_layout_is_learned_per_document(manifests):
+    narrow, wide = manifests
+    expected = [len(st.extract_fedex_pdf(p)) for p in manifests]
+    assert expected == [30, 30]
+    assert len(st.extract_fedex_pdf(narrow, learn_layout=True)) == 30
+    # Same carrier and column count, different widths.
+    learned = st.extract_fedex_pdf(wide, learn_layout=True)
+    assert [s.tracking_number for s in learned] == [s.tracking_number for s in st.extract_fedex_pdf(wide)]
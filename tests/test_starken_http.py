@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""HTTP Starken lookup against a local stand-in of the tracking site."""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shipping_tracker as st  # noqa: E402
+
+# Page payloads by tracking number, embedded as Next.js data.
+PAGES = {
+    # API wrapper status before the shipment record.
+    "111": {"status": "success", "data": {"estado": "ENTREGADO", "fecha_entrega": "02/05/2025"}},
+    # Build flag only: nothing about the shipment.
+    "222": {"runtimeConfig": {"status": "production"}, "props": {"pageProps": {}}},
+    # Unusual wording, accepted because the record names the shipment.
+    "333": {"props": {"pageProps": {"envio": {"orden": "333", "status": "Retenido en aduana"}}}},
+    # Error wrapper of a failed request.
+    "444": {"status": "error", "message": "not found"},
+}
+# Pages that set their state from an inline script instead.
+SCRIPTS = {
+    "555": 'window.__INITIAL_STATE__ = {"envio": {"estado": "En reparto"}};\nwindow.boot();',
+}
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        codigo = parse_qs(url.query).get("codigo", [""])[0]
+        if codigo in SCRIPTS:
+            script = f"<script>{SCRIPTS[codigo]}</script>"
+        else:
+            script = f'<script id="__NEXT_DATA__">{json.dumps(PAGES.get(codigo, {}))}</script>'
+        body = f"<html>{script}</html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_wrapper_status_is_skipped(base_url):
+    assert st.status_starken_http("111", base_url=base_url, api_url="") == "ENTREGADO - 02/05/2025"
+
+
+def test_unrelated_status_falls_back(base_url):
+    assert st.status_starken_http("222", base_url=base_url, api_url="") is None
+
+
+def test_record_with_tracking_number(base_url):
+    assert st.status_starken_http("333", base_url=base_url, api_url="") == "Retenido en aduana"
+
+
+def test_error_wrapper_falls_back(base_url):
+    assert st.status_starken_http("444", base_url=base_url, api_url="") is None
+
+
+def test_inline_state_followed_by_code(base_url):
+    assert st.status_starken_http("555", base_url=base_url, api_url="") == "En reparto"
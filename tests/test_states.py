@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Normalized states of free-form carrier statuses."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shipping_tracker as st  # noqa: E402
+
+
+@pytest.mark.parametrize("status, state", [
+    ("ENTREGADO - 02/05/2025", "entregado"),
+    ("No entregado - destinatario ausente", "no_entregado"),
+    ("Envío NO ENTREGADO", "no_entregado"),
+    ("En reparto", "en_reparto"),
+    ("Error: límite de tiempo alcanzado", "error"),
+])
+def test_normalize_state(status, state):
+    assert st.normalize_state(status) == state
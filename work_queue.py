@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""Share the daily status lookups between several machines.
+
+``shipping_tracker.main()`` owns the results workbook for the whole run.
+This module splits that run into three steps around a SQLite file placed
+in a shared folder:
+
+* ``seed``: one host reads the workbook and the manifests and queues one
+  task per ``(carrier, tracking_number)``,
+* ``work``: any number of hosts lease batches of tasks, look them up and
+  write the results back,
+* ``collect``: one host writes the results into the workbook.
+
+A lease expires after ``--lease`` seconds; tasks of a worker that crashed or
+lost the network are handed out again once their lease expires, and a
+result is only accepted from the worker holding the lease, so a task is not
+looked up twice while its lease is alive.  Workers renew the leases they
+hold while a lookup runs, and a task whose lease expired ``max_attempts``
+times is marked failed instead of being handed out again.  Lease times
+come from each host's clock, which should be kept in sync (NTP).
+
+The database uses SQLite's default rollback journal, since WAL mode does
+not work over network file systems.
+
+Example::
+
+    python work_queue.py seed \\\\servidor\\envios\\cola.db manifiestos --excel envios.xlsx
+    python work_queue.py work \\\\servidor\\envios\\cola.db --threads 2     # en cada equipo
+    python work_queue.py collect \\\\servidor\\envios\\cola.db manifiestos --excel envios.xlsx
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Item = Tuple[str, str]
+
+DEFAULT_LEASE = 600.0
+DEFAULT_BATCH = 10
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds a worker waits before asking again while other hosts hold leases.
+IDLE_POLL = 15.0
+# A lookup still running after this long stops being renewed, so a hung
+# worker eventually loses its lease (5 Cruz del Sur captcha tries fit).
+MAX_LOOKUP_SECONDS = 1800.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    carrier       TEXT NOT NULL,
+    tracking      TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',  -- pending/leased/done/failed
+    result        TEXT,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    updated       REAL,
+    PRIMARY KEY (carrier, tracking)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+class WorkQueue:
+    """Lease-based task table in a SQLite file.
+
+    One instance holds one connection, so each thread needs its own.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        owner: Optional[str] = None,
+        lease_seconds: float = DEFAULT_LEASE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode: transactions are opened explicitly below.
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _write(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        # BEGIN IMMEDIATE takes the write lock up front, so two hosts can
+        # never select the same rows before one of them updates them.
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(sql, tuple(params))
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return cur
+
+    def seed(self, items: Iterable[Item], requeue: bool = False) -> int:
+        """Queue ``items``; return how many were added or re-queued.
+
+        Known tasks are left alone unless ``requeue`` is set, which puts
+        finished ones back in the queue for a new run.
+        """
+
+        rows = [(c, t, time.time()) for c, t in dict.fromkeys(items)]
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (carrier, tracking, updated) VALUES (?, ?, ?)", rows
+            )
+            if requeue:
+                self.conn.executemany(
+                    "UPDATE tasks SET status = 'pending', attempts = 0, lease_owner = NULL,"
+                    " lease_expires = NULL, updated = ?3"
+                    " WHERE carrier = ?1 AND tracking = ?2 AND status IN ('done', 'failed')",
+                    rows,
+                )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return self.conn.total_changes - before
+
+    def lease(self, n: int = DEFAULT_BATCH) -> List[Item]:
+        """Lease up to ``n`` pending or expired tasks to this owner.
+
+        Expired leases that already used ``max_attempts`` (their worker
+        kept dying or hanging) are marked ``failed`` instead.
+        """
+
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', result = COALESCE(result, 'Error: lease vencido'),"
+                " lease_owner = NULL, lease_expires = NULL, updated = ?"
+                " WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = self.conn.execute(
+                "SELECT carrier, tracking FROM tasks"
+                " WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)"
+                " ORDER BY attempts, updated LIMIT ?",
+                (now, n),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated = ? WHERE carrier = ? AND tracking = ?",
+                [(self.owner, now + self.lease_seconds, now, c, t) for c, t in rows],
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return [tuple(r) for r in rows]
+
+    def renew(self, items: Iterable[Item]) -> None:
+        """Extend the leases this owner still holds on ``items``."""
+
+        expires = time.time() + self.lease_seconds
+        for carrier, tracking in items:
+            self._write(
+                "UPDATE tasks SET lease_expires = ? WHERE carrier = ? AND tracking = ?"
+                " AND status = 'leased' AND lease_owner = ?",
+                (expires, carrier, tracking, self.owner),
+            )
+
+    def complete(self, item: Item, result: Optional[str], failed: bool = False) -> bool:
+        """Store the result of a leased task.
+
+        A failed task goes back to the queue until it reaches
+        ``max_attempts``.  Returns ``False`` when the lease was lost.
+        """
+
+        if failed:
+            # Decided in SQL so the attempt counter of this lease is used.
+            status_sql, params = "CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END", [self.max_attempts]
+        else:
+            status_sql, params = "?", ["done"]
+        cur = self._write(
+            f"UPDATE tasks SET status = {status_sql}, result = ?,"
+            " lease_owner = NULL, lease_expires = NULL, updated = ?"
+            " WHERE carrier = ? AND tracking = ? AND status = 'leased' AND lease_owner = ?",
+            params + [result, time.time(), *item, self.owner],
+        )
+        return cur.rowcount == 1
+
+    def release(self, items: Iterable[Item]) -> None:
+        """Give unfinished leases back without counting an attempt."""
+
+        for carrier, tracking in items:
+            self._write(
+                "UPDATE tasks SET status = 'pending', attempts = attempts - 1,"
+                " lease_owner = NULL, lease_expires = NULL"
+                " WHERE carrier = ? AND tracking = ? AND status = 'leased' AND lease_owner = ?",
+                (carrier, tracking, self.owner),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+
+    def results(self) -> Dict[Item, str]:
+        """Results of finished tasks."""
+
+        rows = self.conn.execute(
+            "SELECT carrier, tracking, result FROM tasks WHERE status = 'done'"
+        )
+        return {(c, t): r for c, t, r in rows}
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+
+def lookup_status(carrier: str, tracking: str) -> Optional[str]:
+    """Status of one task, or ``None`` when the carrier gave no answer."""
+
+    from shipping_tracker import Shipment, consulta_cruz_del_sur, update_status  # lazy import
+
+    if carrier.lower() == "cruz del sur":
+        return consulta_cruz_del_sur(tracking)
+    return update_status(Shipment(carrier, tracking, "", carrier)).status
+
+
+def _heartbeat(
+    queue: WorkQueue,
+    held: List[Item],
+    started: List[float],
+    stop: threading.Event,
+    max_lookup: float,
+) -> None:
+    """Renew the leases in ``held`` until ``stop`` is set.
+
+    ``held[0]`` is the item being looked up since ``started[0]``; it is
+    dropped from the renewals once it runs longer than ``max_lookup``.
+    """
+
+    # SQLite connections belong to one thread, so the heartbeat has its own.
+    beat = WorkQueue(queue.path, owner=queue.owner, lease_seconds=queue.lease_seconds)
+    try:
+        while not stop.wait(queue.lease_seconds / 3):
+            items = list(held)
+            if items and time.time() - started[0] > max_lookup:
+                items = items[1:]
+            try:
+                beat.renew(items)
+            except sqlite3.Error as exc:  # share busy; retry on the next beat
+                print(f"No se pudo renovar el lease: {exc}")
+    finally:
+        beat.close()
+
+
+def run_worker(
+    queue: WorkQueue,
+    lookup: Callable[[str, str], Optional[str]] = lookup_status,
+    batch: int = DEFAULT_BATCH,
+    idle_poll: float = IDLE_POLL,
+    max_lookup: float = MAX_LOOKUP_SECONDS,
+) -> int:
+    """Lease and look up tasks until none are left; return how many were done.
+
+    While a batch is being worked on, a heartbeat thread keeps renewing the
+    leases of the item in progress and of the items still waiting.
+    """
+
+    from shipping_tracker import normalize_state  # lazy import
+
+    done = 0
+    held: List[Item] = []
+    started = [time.time()]
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat, args=(queue, held, started, stop, max_lookup),
+        name="queue-heartbeat", daemon=True,
+    )
+    beat.start()
+    try:
+        while True:
+            items = queue.lease(batch)
+            if not items:
+                counts = queue.counts()
+                if not counts.get("pending") and not counts.get("leased"):
+                    return done
+                # Other hosts still hold leases; take over any that expire.
+                time.sleep(idle_poll)
+                continue
+            for i, item in enumerate(items):
+                held[:] = items[i:]
+                started[0] = time.time()
+                try:
+                    status = lookup(*item)
+                except BaseException:
+                    held.clear()
+                    queue.release(items[i:])
+                    raise
+                held[:] = items[i + 1:]
+                failed = not status or normalize_state(status) == "error"
+                if queue.complete(item, status, failed=failed):
+                    done += not failed
+                else:
+                    print(f"Lease vencido, se descarta el resultado de {item[1]}")
+    finally:
+        stop.set()
+        beat.join()
+
+
+# ---------------------------------------------------------------------------
+# Seed / collect against the results workbook
+# ---------------------------------------------------------------------------
+
+
+def _gather(excel_path: str, directory: str):
+    """Rows of the workbook plus new manifest rows, as ``_run`` builds them.
+
+    Returns ``(shipments, cruz_tracking)``; only the first Cruz del Sur
+    manifest row is queried, like in ``shipping_tracker``.
+    """
+
+    from shipping_tracker import _iter_excel_values, _row_to_shipment, iter_shipments  # lazy import
+
+    shipments = []
+    if os.path.exists(excel_path):
+        rows = _iter_excel_values(excel_path)
+        next(rows, None)  # header
+        shipments = [_row_to_shipment(r) for r in rows if any(v is not None for v in r)]
+    existing = {s.tracking_number for s in shipments}
+    cruz_tracking = None
+    for file in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file)
+        if os.path.abspath(path) == excel_path:
+            continue
+        for item in iter_shipments(path):
+            if item.carrier == "Cruz del Sur" and cruz_tracking is None:
+                cruz_tracking = item.tracking_number
+            if item.tracking_number not in existing:
+                existing.add(item.tracking_number)
+                shipments.append(item)
+    return shipments, cruz_tracking
+
+
+def _tasks(shipments, cruz_tracking: Optional[str]) -> List[Item]:
+    items = []
+    for s in shipments:
+        carrier = s.carrier.lower()
+        if carrier in {"fedex", "correos de chile", "starken"}:
+            items.append((s.carrier, s.tracking_number))
+        elif carrier == "cruz del sur" and s.tracking_number == cruz_tracking:
+            items.append((s.carrier, s.tracking_number))
+    return items
+
+
+def collect(queue: WorkQueue, excel_path: str, directory: str) -> int:
+    """Write finished results into the workbook; return the rows updated."""
+
+    import pandas as pd  # lazy import
+
+    from shipping_tracker import RESULT_COLUMNS  # lazy import
+
+    shipments, _ = _gather(excel_path, directory)
+    results = queue.results()
+    updated = 0
+    for s in shipments:
+        status = results.get((s.carrier, s.tracking_number))
+        if status is not None:
+            s.status = status
+            updated += 1
+        elif s.carrier.lower() == "cruz del sur":
+            s.status = s.status or "Requiere consulta manual"
+    pd.DataFrame([
+        [s.carrier, s.tracking_number, s.consignee, s.company, s.reference, s.status]
+        for s in shipments
+    ], columns=RESULT_COLUMNS).to_excel(excel_path, index=False)
+    return updated
+
+
+# ---------------------------------------------------------------------------
+# Example CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:  # pragma: no cover - CLI helper
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cola de consultas compartida entre equipos")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed_p = sub.add_parser("seed", help="Cargar las consultas del día en la cola")
+    seed_p.add_argument("db")
+    seed_p.add_argument("directory", help="Carpeta con los manifiestos")
+    seed_p.add_argument("--excel", default="envios.xlsx")
+    seed_p.add_argument("--requeue", action="store_true", help="Volver a consultar las ya terminadas")
+
+    work_p = sub.add_parser("work", help="Procesar consultas de la cola")
+    work_p.add_argument("db")
+    work_p.add_argument("--threads", type=int, default=1)
+    work_p.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    work_p.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="Segundos de cada lease")
+
+    collect_p = sub.add_parser("collect", help="Escribir los resultados en el Excel")
+    collect_p.add_argument("db")
+    collect_p.add_argument("directory", help="Carpeta con los manifiestos")
+    collect_p.add_argument("--excel", default="envios.xlsx")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        queue = WorkQueue(args.db)
+        shipments, cruz_tracking = _gather(os.path.abspath(args.excel), args.directory)
+        added = queue.seed(_tasks(shipments, cruz_tracking), requeue=args.requeue)
+        print(f"{added} consultas en cola; estado: {queue.counts()}")
+    elif args.command == "work":
+        totals: List[int] = []
+
+        def worker() -> None:
+            queue = WorkQueue(args.db, lease_seconds=args.lease)
+            try:
+                totals.append(run_worker(queue, batch=args.batch))
+            finally:
+                queue.close()
+
+        threads = [threading.Thread(target=worker, name=f"queue-{i}") for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"{sum(totals)} consultas resueltas en este equipo")
+    else:
+        queue = WorkQueue(args.db)
+        counts = queue.counts()
+        if counts.get("pending") or counts.get("leased"):
+            print(f"⚠ Quedan consultas sin terminar: {counts}")
+        updated = collect(queue, os.path.abspath(args.excel), args.directory)
+        print(f"Excel actualizado: {updated} estados")
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI
+    main()